@@ -2,13 +2,195 @@
 Analytics engine with rule-based recommendations
 Generates spending insights and actionable advice in Spanish
 """
-from typing import List, Dict, Optional
-from datetime import datetime, timedelta
-from sqlalchemy.orm import Session
-from sqlalchemy import func, extract
+import os
+import re
+import threading
+from typing import List, Dict, Optional, Tuple
+from dataclasses import dataclass
+from functools import lru_cache
+from datetime import timedelta
+from cachetools import TTLCache
+from sqlalchemy.orm import Session, object_session
+from sqlalchemy import func, extract, select, event, bindparam, cast, Integer
 from . import models, schemas
 
 
+# Per-user caches for data that only changes when statements or transactions are written
+CACHE_TTL_SECONDS = 300
+# The caches live in each process and invalidation only reaches the worker that
+# handled the write, so with several uvicorn workers (WEB_CONCURRENCY > 1) they
+# are off: other workers would serve stale periods for up to CACHE_TTL_SECONDS
+CACHE_ENABLED = int(os.getenv("WEB_CONCURRENCY", "1")) <= 1
+_periods_cache: TTLCache = TTLCache(maxsize=10_000, ttl=CACHE_TTL_SECONDS)
+_dolar_rate_cache: TTLCache = TTLCache(maxsize=10_000, ttl=CACHE_TTL_SECONDS)
+# Endpoints run in FastAPI's threadpool and TTLCache is not thread-safe
+_cache_lock = threading.Lock()
+
+
+@dataclass(slots=True)
+class _CategoryTotal:
+    """Running total/count for one category in the breakdown"""
+    total: float = 0.0
+    count: int = 0
+
+
+def invalidate_user_cache(user_id: int) -> None:
+    """Drop cached periods and dolar rates for a user"""
+    with _cache_lock:
+        _periods_cache.pop(user_id, None)
+        _dolar_rate_cache.pop(user_id, None)
+
+
+# Users whose cached data a session's flushes changed, cleared once it commits
+_PENDING_INVALIDATION = "analytics_invalidate_user_ids"
+
+
+@event.listens_for(models.Statement, "after_insert")
+@event.listens_for(models.Statement, "after_update")
+@event.listens_for(models.Statement, "after_delete")
+# The cached dolar rate comes from the first matching transaction, so adding
+# or deleting a transaction can change it too
+@event.listens_for(models.Transaction, "after_insert")
+@event.listens_for(models.Transaction, "after_update")
+@event.listens_for(models.Transaction, "after_delete")
+def _invalidate_on_change(mapper, connection, target):
+    # Flush runs before commit: invalidating now would let a concurrent request
+    # re-cache the pre-commit data, so defer until the session commits
+    session = object_session(target)
+    if session is None:
+        invalidate_user_cache(target.user_id)
+        return
+    session.info.setdefault(_PENDING_INVALIDATION, set()).add(target.user_id)
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_after_commit(session):
+    for user_id in session.info.pop(_PENDING_INVALIDATION, ()):
+        invalidate_user_cache(user_id)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_pending_invalidation(session):
+    session.info.pop(_PENDING_INVALIDATION, None)
+
+
+# Grouping expressions for the spending trend, built once so every request
+# reuses the same construct (and hits SQLAlchemy's compiled-statement cache).
+# Month buckets are integers (YYYYMM) built with EXTRACT, which SQLAlchemy
+# renders for both SQLite and PostgreSQL.
+_TREND_BUCKETS = {
+    "day": func.date(models.Transaction.date),
+    "month": extract('year', models.Transaction.date) * 100 + extract('month', models.Transaction.date),
+}
+
+# Week buckets (YYYYWW) differ per dialect: the week number has to be paired
+# with the year it belongs to, or Dec 29-31 / Jan 1-3 land in the wrong bucket
+_WEEK_BUCKETS = {
+    # %W weeks start on Monday and never cross the calendar year (days before
+    # the first Monday are week 00), so %Y is the matching year
+    "sqlite": (
+        cast(func.strftime('%Y', models.Transaction.date), Integer) * 100
+        + cast(func.strftime('%W', models.Transaction.date), Integer)
+    ),
+    # EXTRACT(week) is the ISO week, which belongs to the ISO year
+    "postgresql": extract('isoyear', models.Transaction.date) * 100 + extract('week', models.Transaction.date),
+}
+
+# Trend granularity for each analytics period
+_TREND_GRAINS = {"month": "day", "quarter": "week", "year": "month"}
+
+MONTH_NAMES = ['Ene', 'Feb', 'Mar', 'Abr', 'May', 'Jun', 'Jul', 'Ago', 'Sep', 'Oct', 'Nov', 'Dic']
+
+# Category names that count as food for the recommendation rules
+_FOOD_RE = re.compile(r"comida|restaurant", re.IGNORECASE)
+
+
+def _where_period(stmt, by_currency: bool, by_month: bool, by_year: bool):
+    """Add get_analytics' filters to stmt as bind parameters (Statement must be joined for month/year)"""
+    stmt = stmt.where(models.Transaction.user_id == bindparam("user_id"))
+    if by_currency:
+        stmt = stmt.where(models.Transaction.is_dollar == bindparam("is_dollar"))
+    if by_month:
+        stmt = stmt.where(models.Statement.month == bindparam("month"))
+    if by_year:
+        stmt = stmt.where(models.Statement.year == bindparam("year"))
+    return stmt
+
+
+def _select_transactions(columns: tuple, by_currency: bool, by_month: bool, by_year: bool):
+    """Select columns over the user's transactions matching get_analytics' filters"""
+    stmt = select(*columns).select_from(models.Transaction)
+    if by_month or by_year:
+        stmt = stmt.join(models.Statement)
+    return _where_period(stmt, by_currency, by_month, by_year)
+
+
+# The analytics statements below are built once per filter shape
+# (currency/month/year present or not) and executed with bind parameters,
+# so each request skips query construction and hits the compiled cache.
+
+@lru_cache(maxsize=None)
+def _category_totals_stmt(by_currency: bool, by_month: bool, by_year: bool):
+    """One row per (category, currency) with the summed amount and count"""
+    return _select_transactions(
+        (
+            models.Transaction.category_id,
+            models.Transaction.is_dollar,
+            func.sum(models.Transaction.amount),
+            func.count(models.Transaction.id)
+        ),
+        by_currency, by_month, by_year
+    ).group_by(
+        models.Transaction.category_id,
+        models.Transaction.is_dollar
+    )
+
+
+@lru_cache(maxsize=None)
+def _small_purchases_stmt(by_currency: bool, by_month: bool, by_year: bool):
+    """Count and total of purchases under $500"""
+    return _select_transactions(
+        (
+            func.count(models.Transaction.id),
+            func.coalesce(func.sum(models.Transaction.amount), 0.0)
+        ),
+        by_currency, by_month, by_year
+    ).where(models.Transaction.amount < 500)
+
+
+@lru_cache(maxsize=None)
+def _first_dolar_rate_stmt(by_currency: bool, by_month: bool, by_year: bool):
+    """Dólar rate of the statement of the first matching transaction"""
+    stmt = select(models.Statement.dolar_rate).select_from(
+        models.Transaction
+    ).outerjoin(models.Statement)
+    return _where_period(stmt, by_currency, by_month, by_year).order_by(
+        models.Transaction.id
+    ).limit(1)
+
+
+def _get_dolar_rate(db: Session, user_id: int, shape: Tuple, params: dict) -> float:
+    """Dólar tarjeta rate of the statement of the first matching transaction (cached)"""
+    period_key = (params["is_dollar"], params["month"], params["year"])
+    if CACHE_ENABLED:
+        with _cache_lock:
+            user_rates = _dolar_rate_cache.get(user_id)
+            if user_rates is not None and period_key in user_rates:
+                return user_rates[period_key]
+    
+    rate = db.execute(_first_dolar_rate_stmt(*shape), params).scalar() or 0.0
+    if not CACHE_ENABLED:
+        return rate
+    
+    with _cache_lock:
+        user_rates = _dolar_rate_cache.get(user_id)
+        if user_rates is None:
+            user_rates = _dolar_rate_cache[user_id] = {}
+        user_rates[period_key] = rate
+    
+    return rate
+
+
 def get_analytics(
     db: Session,
     user_id: int,
@@ -23,98 +205,97 @@ def get_analytics(
     is_dollar: filter by currency (True=USD, False=ARS, None=all)
     month/year: filter by specific month and year
     """
-    # Build base query
-    query = db.query(models.Transaction).filter(
-        models.Transaction.user_id == user_id
-    )
-    
-    # Only filter by currency if specified
-    if is_dollar is not None:
-        query = query.filter(models.Transaction.is_dollar == is_dollar)
+    # Filter shape selects the prebuilt statement; values are bound at execution
+    shape = (is_dollar is not None, bool(month), bool(year))
+    params = {"user_id": user_id, "is_dollar": is_dollar, "month": month, "year": year}
     
-    # Filter by specific month/year if provided
     if month and year:
-        # Join with Statement and filter by statement period
-        query = query.join(models.Statement).filter(
-            models.Statement.month == month,
-            models.Statement.year == year
-        )
+        # Filter by statement period
         period_label = f"{month}/{year}"
     elif month:
         # Filter by month only (all years)
-        query = query.join(models.Statement).filter(
-            models.Statement.month == month
-        )
         period_label = f"Mes {month}"
     elif year:
-        # Join with Statement and filter by statement year
-        query = query.join(models.Statement).filter(
-            models.Statement.year == year
-        )
+        # Filter by statement year
         period_label = str(year)
     else:
         # No filter: return ALL transactions from all statements
         # This is the "Todos los meses / Todos los años" case
         period_label = "Todos los períodos"
     
-    transactions = query.all()
+    # Aggregate in SQL: one row per (category, currency) instead of one per transaction
+    rows = db.execute(_category_totals_stmt(*shape), params).all()
     
     # Calculate totals - separate ARS and USD
-    total_ars = sum(t.amount for t in transactions if not t.is_dollar)
-    total_usd = sum(t.amount for t in transactions if t.is_dollar)
+    total_ars = 0.0
+    total_usd = 0.0
+    transaction_count = 0
+    category_totals: Dict[int, _CategoryTotal] = {}
+    for category_id, row_is_dollar, amount, count in rows:
+        if row_is_dollar:
+            total_usd += amount
+        else:
+            total_ars += amount
+        transaction_count += count
+        if category_id:
+            entry = category_totals.get(category_id)
+            if entry is None:
+                entry = category_totals[category_id] = _CategoryTotal()
+            entry.total += amount
+            entry.count += count
     
-    # Get dolar_rate from the relevant statement
+    # Get dolar_rate from the statement of the first matching transaction
     dolar_rate = 0.0
-    if transactions and transactions[0].statement:
-        dolar_rate = transactions[0].statement.dolar_rate or 0.0
+    if transaction_count:
+        dolar_rate = _get_dolar_rate(db, user_id, shape, params)
     
     # Calculate unified total (ARS + USD converted to ARS)
     total_unified = total_ars + (total_usd * dolar_rate) if dolar_rate > 0 else total_ars
     
     # Legacy total_spending (sum of all amounts as-is for backwards compatibility)
-    total_spending = sum(t.amount for t in transactions)
-    transaction_count = len(transactions)
+    total_spending = total_ars + total_usd
     avg_transaction = total_spending / transaction_count if transaction_count > 0 else 0
     
-    # Category breakdown
-    category_totals: Dict[int, dict] = {}
-    for t in transactions:
-        if t.category_id:
-            if t.category_id not in category_totals:
-                cat = t.category
-                category_totals[t.category_id] = {
-                    "name": cat.name if cat else "Sin categoría",
-                    "icon": cat.icon if cat else "📦",
-                    "color": cat.color if cat else "#778899",
-                    "total": 0,
-                    "count": 0
-                }
-            category_totals[t.category_id]["total"] += t.amount
-            category_totals[t.category_id]["count"] += 1
+    # Category metadata in a single query
+    categories = {}
+    if category_totals:
+        categories = {
+            c.id: c for c in db.query(models.Category).filter(
+                models.Category.id.in_(category_totals.keys())
+            )
+        }
     
     # Convert to response format with percentages
+    # (model_construct skips validation: every value here is computed, not user input)
     category_breakdown = []
     for cat_id, data in category_totals.items():
-        percentage = (data["total"] / total_spending * 100) if total_spending > 0 else 0
-        category_breakdown.append(schemas.CategorySummary(
+        cat = categories.get(cat_id)
+        percentage = (data.total / total_spending * 100) if total_spending > 0 else 0
+        category_breakdown.append(schemas.CategorySummary.model_construct(
             category_id=cat_id,
-            category_name=data["name"],
-            category_icon=data["icon"],
-            category_color=data["color"],
-            total=round(data["total"], 2),
-            count=data["count"],
+            category_name=cat.name if cat else "Sin categoría",
+            category_icon=cat.icon if cat else "📦",
+            category_color=cat.color if cat else "#778899",
+            total=round(data.total, 2),
+            count=data.count,
             percentage=round(percentage, 1)
         ))
     
     # Sort by total (highest first)
     category_breakdown.sort(key=lambda x: x.total, reverse=True)
     
+    # Small purchases only matter for the ARS rules; count and sum them in SQL
+    small_count, small_total = 0, 0.0
+    if transaction_count and not is_dollar:
+        small_count, small_total = db.execute(_small_purchases_stmt(*shape), params).one()
+    
     # Generate recommendations
     recommendations = generate_recommendations(
-        db, user_id, transactions, category_breakdown, total_spending, period, is_dollar
+        db, user_id, transaction_count, category_breakdown, total_spending, period, is_dollar,
+        small_count, small_total
     )
     
-    return schemas.AnalyticsResponse(
+    return schemas.AnalyticsResponse.model_construct(
         total_spending=round(total_spending, 2),
         total_ars=round(total_ars, 2),
         total_usd=round(total_usd, 2),
@@ -131,21 +312,24 @@ def get_analytics(
 def generate_recommendations(
     db: Session,
     user_id: int,
-    transactions: List[models.Transaction],
+    transaction_count: int,
     category_breakdown: List[schemas.CategorySummary],
     total_spending: float,
     period: str,
-    is_dollar: bool = False
+    is_dollar: bool = False,
+    small_count: int = 0,
+    small_total: float = 0.0
 ) -> List[schemas.Recommendation]:
     """
     Generate actionable recommendations based on spending patterns.
     Rules-based system with Argentinian Spanish messages.
+    small_count/small_total: purchases under $500 (only needed for ARS rules)
     """
     recommendations = []
     currency = "USD" if is_dollar else "ARS"
     
-    if not transactions:
-        recommendations.append(schemas.Recommendation(
+    if not transaction_count:
+        recommendations.append(schemas.Recommendation.model_construct(
             type="info",
             icon="📊",
             message=f"Todavía no tenés transacciones en {currency} en este período. ¡Subí tu resumen para empezar a analizar!"
@@ -153,7 +337,7 @@ def generate_recommendations(
         return recommendations
     
     # Calculate previous period for comparison
-    now = datetime.utcnow()
+    now = models.utcnow()
     if period == "month":
         prev_start = now - timedelta(days=60)
         prev_end = now - timedelta(days=30)
@@ -161,25 +345,27 @@ def generate_recommendations(
         prev_start = now - timedelta(days=180)
         prev_end = now - timedelta(days=90)
     
-    prev_transactions = db.query(models.Transaction).filter(
+    # Only the total is needed, so let the DB sum it (served by ix_tx_user_curr_date)
+    prev_total = db.query(
+        func.coalesce(func.sum(models.Transaction.amount), 0.0)
+    ).filter(
         models.Transaction.user_id == user_id,
         models.Transaction.is_dollar == is_dollar,
         models.Transaction.date >= prev_start,
         models.Transaction.date < prev_end
-    ).all()
-    prev_total = sum(t.amount for t in prev_transactions)
+    ).scalar()
     
     # Rule 1: Compare to previous period
     if prev_total > 0:
         change_percent = ((total_spending - prev_total) / prev_total) * 100
         if change_percent > 20:
-            recommendations.append(schemas.Recommendation(
+            recommendations.append(schemas.Recommendation.model_construct(
                 type="warning",
                 icon="📈",
                 message=f"¡Ojo! Gastaste {abs(change_percent):.0f}% más que el período anterior en {currency}."
             ))
         elif change_percent < -10:
-            recommendations.append(schemas.Recommendation(
+            recommendations.append(schemas.Recommendation.model_construct(
                 type="success",
                 icon="🎉",
                 message=f"¡Muy bien! Redujiste tus gastos un {abs(change_percent):.0f}% en {currency}."
@@ -189,13 +375,13 @@ def generate_recommendations(
     if category_breakdown:
         top_cat = category_breakdown[0]
         if top_cat.percentage > 40:
-            recommendations.append(schemas.Recommendation(
+            recommendations.append(schemas.Recommendation.model_construct(
                 type="warning",
                 icon="⚠️",
                 message=f"Tu categoría top '{top_cat.category_name}' representa el {top_cat.percentage:.0f}% de tus gastos."
             ))
         elif top_cat.percentage > 25:
-            recommendations.append(schemas.Recommendation(
+            recommendations.append(schemas.Recommendation.model_construct(
                 type="info",
                 icon="📍",
                 message=f"La mayor parte de tus gastos ({top_cat.percentage:.0f}%) va a '{top_cat.category_name}'."
@@ -204,39 +390,39 @@ def generate_recommendations(
     # USD-specific recommendations
     if is_dollar:
         # Rule: Subscription count for USD
-        if len(transactions) >= 3:
-            recommendations.append(schemas.Recommendation(
+        if transaction_count >= 3:
+            recommendations.append(schemas.Recommendation.model_construct(
                 type="tip",
                 icon="💳",
-                message=f"Tenés {len(transactions)} suscripciones en USD (${total_spending:.2f}). ¿Las usás todas?"
+                message=f"Tenés {transaction_count} suscripciones en USD (${total_spending:.2f}). ¿Las usás todas?"
             ))
     else:
         # ARS-specific rules
         # Rule 3: Food/delivery spending
-        food_cats = [c for c in category_breakdown if "comida" in c.category_name.lower() or "restaurant" in c.category_name.lower()]
-        if food_cats:
-            food_total = sum(c.total for c in food_cats)
-            food_percent = (food_total / total_spending * 100) if total_spending > 0 else 0
-            if food_percent > 30:
-                recommendations.append(schemas.Recommendation(
-                    type="tip",
-                    icon="🍳",
-                    message=f"Gastás {food_percent:.0f}% en comida. Cocinar más en casa podría ahorrarte bastante."
-                ))
+        # (single pass over the breakdown, no intermediate list of food categories)
+        food_total = 0.0
+        for c in category_breakdown:
+            if _FOOD_RE.search(c.category_name):
+                food_total += c.total
+        food_percent = (food_total / total_spending * 100) if total_spending > 0 else 0
+        if food_percent > 30:
+            recommendations.append(schemas.Recommendation.model_construct(
+                type="tip",
+                icon="🍳",
+                message=f"Gastás {food_percent:.0f}% en comida. Cocinar más en casa podría ahorrarte bastante."
+            ))
         
         # Rule 4: Small purchases add up
-        small_purchases = [t for t in transactions if t.amount < 500]
-        if len(small_purchases) > 10:
-            small_total = sum(t.amount for t in small_purchases)
-            recommendations.append(schemas.Recommendation(
+        if small_count > 10:
+            recommendations.append(schemas.Recommendation.model_construct(
                 type="info",
                 icon="💸",
-                message=f"Tenés {len(small_purchases)} compras chicas que suman ${small_total:.0f}."
+                message=f"Tenés {small_count} compras chicas que suman ${small_total:.0f}."
             ))
     
     # Ensure we always have at least one recommendation
     if not recommendations:
-        recommendations.append(schemas.Recommendation(
+        recommendations.append(schemas.Recommendation.model_construct(
             type="success",
             icon="✅",
             message=f"¡Tus gastos en {currency} se ven bien balanceados!"
@@ -246,6 +432,49 @@ def generate_recommendations(
     return recommendations[:5]
 
 
+@lru_cache(maxsize=None)
+def _trend_stmt(
+    dialect: str,
+    grain: str,
+    by_currency: bool,
+    by_statement_period: bool,
+    by_date_year: bool,
+    since: bool
+):
+    """
+    Spending per time bucket (day/week/month), built once per dialect, grain
+    and filter shape and executed with bind parameters.
+    """
+    if grain == "week":
+        bucket = _WEEK_BUCKETS["sqlite" if dialect == "sqlite" else "postgresql"]
+    else:
+        bucket = _TREND_BUCKETS[grain]
+    stmt = select(
+        bucket.label("bucket"),
+        func.sum(models.Transaction.amount).label("total")
+    ).select_from(models.Transaction)
+    
+    if by_statement_period:
+        stmt = stmt.join(models.Statement)
+    stmt = _where_period(stmt, by_currency, by_statement_period, by_statement_period)
+    
+    if by_date_year:
+        stmt = stmt.where(extract('year', models.Transaction.date) == bindparam("year"))
+    if since:
+        stmt = stmt.where(models.Transaction.date >= bindparam("since"))
+    
+    return stmt.group_by(bucket).order_by(bucket)
+
+
+def _trend_label(grain: str, bucket) -> str:
+    """Format a trend bucket for the chart axis"""
+    if grain == "day":
+        return str(bucket)
+    if grain == "week":
+        return f"Semana {int(bucket) % 100:02d}"
+    return MONTH_NAMES[int(bucket) % 100 - 1]
+
+
 def get_spending_trend(
     db: Session,
     user_id: int,
@@ -256,114 +485,81 @@ def get_spending_trend(
 ) -> List[dict]:
     """
     Get spending trend based on period:
-    - month: daily data for 30 days
+    - month: daily data (for the selected statement if month and year are given)
     - quarter: weekly data for 12 weeks
-    - year: monthly data for 12 months
+    - year: monthly data for 12 months (or the given calendar year)
     is_dollar: None = all currencies
     """
-    now = datetime.utcnow()
-    
-    # Build base query filter
-    base_filter = [
-        models.Transaction.user_id == user_id
-    ]
-    
-    # Only filter by currency if specified
-    if is_dollar is not None:
-        base_filter.append(models.Transaction.is_dollar == is_dollar)
+    now = models.utcnow()
+    grain = _TREND_GRAINS.get(period, "month")
+    params = {
+        "user_id": user_id,
+        "is_dollar": is_dollar,
+        "month": month,
+        "year": year,
+        "since": None,
+    }
     
+    by_statement_period = False
+    by_date_year = False
     if period == "month":
-        # Daily data
-        if month and year:
-            # JOIN with Statement for filtering
-            # But group by DATE for trend visualization
-            
-            # Re-build query since we accept filters above but here we need aggregate
-            query = db.query(
-                func.date(models.Transaction.date).label("date"),
-                func.sum(models.Transaction.amount).label("total")
-            ).join(models.Statement).filter(
-                models.Statement.month == month,
-                models.Statement.year == year,
-                models.Transaction.user_id == user_id
-            )
-            
-            if is_dollar is not None:
-                query = query.filter(models.Transaction.is_dollar == is_dollar)
-                
-            results = query.group_by(func.date(models.Transaction.date)).order_by(func.date(models.Transaction.date)).all()
-            
-        else:
-            # No filter: return ALL transactions grouped by date
-            results = db.query(
-                func.date(models.Transaction.date).label("date"),
-                func.sum(models.Transaction.amount).label("total")
-            ).filter(
-                models.Transaction.user_id == user_id
-            )
-            
-            if is_dollar is not None:
-                results = results.filter(models.Transaction.is_dollar == is_dollar)
-                
-            results = results.group_by(func.date(models.Transaction.date)).order_by(func.date(models.Transaction.date)).all()
-
-        return [{"date": str(r.date), "total": float(r.total)} for r in results]
-    
+        # Group by DATE for trend visualization, filtered by statement period if given
+        by_statement_period = bool(month and year)
     elif period == "quarter":
-        # Weekly data for 12 weeks
-        start_date = now - timedelta(weeks=12)
-        base_filter.append(models.Transaction.date >= start_date)
-        
-        # Group by week
-        results = db.query(
-            func.strftime('%Y-%W', models.Transaction.date).label("week"),
-            func.sum(models.Transaction.amount).label("total")
-        ).filter(*base_filter).group_by(
-            func.strftime('%Y-%W', models.Transaction.date)
-        ).order_by(
-            func.strftime('%Y-%W', models.Transaction.date)
-        ).all()
-        
-        return [{"date": f"Semana {r.week.split('-')[1]}", "total": float(r.total)} for r in results]
+        params["since"] = now - timedelta(weeks=12)
+    elif year:
+        by_date_year = True
+    else:
+        params["since"] = now - timedelta(days=365)
     
-    else:  # year
-        # Monthly data for 12 months
-        if year:
-            base_filter.append(extract('year', models.Transaction.date) == year)
-        else:
-            start_date = now - timedelta(days=365)
-            base_filter.append(models.Transaction.date >= start_date)
-        
-        # Group by month
-        results = db.query(
-            func.strftime('%Y-%m', models.Transaction.date).label("month"),
-            func.sum(models.Transaction.amount).label("total")
-        ).filter(*base_filter).group_by(
-            func.strftime('%Y-%m', models.Transaction.date)
+    stmt = _trend_stmt(
+        db.get_bind().dialect.name, grain, is_dollar is not None, by_statement_period, by_date_year, params["since"] is not None
+    )
+    results = db.execute(stmt, params).all()
+    
+    return [{"date": _trend_label(grain, r.bucket), "total": float(r.total)} for r in results]
+
+
+def get_latest_statement(db: Session, user_id: int) -> Optional[models.Statement]:
+    """Get the user's most recent statement by period (uses ix_statement_user_period)"""
+    return db.execute(
+        select(models.Statement).where(
+            models.Statement.user_id == user_id
         ).order_by(
-            func.strftime('%Y-%m', models.Transaction.date)
-        ).all()
-        
-        month_names = ['Ene', 'Feb', 'Mar', 'Abr', 'May', 'Jun', 'Jul', 'Ago', 'Sep', 'Oct', 'Nov', 'Dic']
-        return [{"date": month_names[int(r.month.split('-')[1]) - 1], "total": float(r.total)} for r in results]
+            models.Statement.year.desc(),
+            models.Statement.month.desc()
+        ).limit(1)
+    ).scalar_one_or_none()
 
 
 def get_available_periods(db: Session, user_id: int) -> dict:
-    """Get available months and years that have transaction data"""
+    """Get available months and years that have transaction data (cached per user)"""
+    if CACHE_ENABLED:
+        with _cache_lock:
+            cached = _periods_cache.get(user_id)
+        if cached is not None:
+            return cached
+    
     # Get distinct months/years from statements
-    statements = db.query(
-        models.Statement.month,
-        models.Statement.year
-    ).filter(
-        models.Statement.user_id == user_id
-    ).distinct().order_by(
-        models.Statement.year.desc(),
-        models.Statement.month.desc()
+    statements = db.execute(
+        select(
+            models.Statement.month,
+            models.Statement.year
+        ).where(
+            models.Statement.user_id == user_id
+        ).distinct().order_by(
+            models.Statement.year.desc(),
+            models.Statement.month.desc()
+        )
     ).all()
     
     months = [{"month": s.month, "year": s.year} for s in statements]
     years = list(set(s.year for s in statements))
     years.sort(reverse=True)
     
-    return {"months": months, "years": years}
+    result = {"months": months, "years": years}
+    if CACHE_ENABLED:
+        with _cache_lock:
+            _periods_cache[user_id] = result
+    return result
 
@@ -2,46 +2,65 @@
 Authentication system with JWT tokens
 """
 import os
-from datetime import datetime, timedelta
-from typing import Optional
+import time
+import threading
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import NamedTuple, Optional, Tuple
+import bcrypt
+from cachetools import TTLCache
 from fastapi import Depends, HTTPException, status
+from fastapi.concurrency import run_in_threadpool
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from jose import JWTError, jwt
-from passlib.context import CryptContext
 from sqlalchemy.orm import Session
-from sqlalchemy import or_
+from sqlalchemy import or_, select, insert
 from . import models, schemas
 from .database import get_db
 
+logger = logging.getLogger(__name__)
+
 # Security configuration
 SECRET_KEY = os.getenv("SECRET_KEY", "cardtrack-super-secret-key-change-in-production-2024")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 24 * 7  # 7 days
 
-# Password hashing
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Password hashing (bcrypt called directly; same $2b$ hashes passlib produced)
+BCRYPT_ROUNDS = 12
 
 # Bearer token security
 security = HTTPBearer()
 
+# Recently decoded tokens (signature already verified); "exp" is re-checked on hit
+_token_cache: TTLCache = TTLCache(maxsize=10_000, ttl=60)
+_token_cache_lock = threading.Lock()  # also used from threadpool dependencies
+
+# Tokens carry username/is_active claims, but deactivating or deleting a user
+# must take effect before the token expires; re-check the row at most this often
+USER_STATUS_TTL_SECONDS = 60
+_user_active_cache: TTLCache = TTLCache(maxsize=10_000, ttl=USER_STATUS_TTL_SECONDS)  # guarded by _token_cache_lock
+
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     """Verify a password against its hash"""
-    return pwd_context.verify(plain_password, hashed_password)
+    try:
+        return bcrypt.checkpw(plain_password.encode("utf-8"), hashed_password.encode("utf-8"))
+    except ValueError:
+        return False
 
 
 def get_password_hash(password: str) -> str:
     """Hash a password"""
-    return pwd_context.hash(password)
+    return bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt(rounds=BCRYPT_ROUNDS)).decode("utf-8")
 
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
     """Create a JWT access token"""
     to_encode = data.copy()
     if expires_delta:
-        expire = datetime.utcnow() + expires_delta
+        expire = datetime.now(timezone.utc) + expires_delta
     else:
-        expire = datetime.utcnow() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+        expire = datetime.now(timezone.utc) + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     to_encode.update({"exp": expire})
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
@@ -49,82 +68,153 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -
 
 def decode_token(token: str) -> Optional[dict]:
     """Decode and validate a JWT token"""
+    with _token_cache_lock:
+        cached = _token_cache.get(token)
+    if cached is not None and cached.get("exp", 0) > time.time():
+        return cached
+    
     try:
-        print(f"[DECODE] Attempting to decode token with SECRET_KEY: {SECRET_KEY[:20]}...")
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        print(f"[DECODE] Success: {payload}")
-        return payload
     except JWTError as e:
-        print(f"[DECODE] JWTError: {e}")
+        logger.debug("JWTError decoding token ...%s: %s", token[-4:], e)
         return None
     except Exception as e:
-        print(f"[DECODE] Unexpected error: {e}")
+        logger.warning("Unexpected error decoding token ...%s: %s", token[-4:], e)
         return None
+    
+    with _token_cache_lock:
+        _token_cache[token] = payload
+    return payload
 
 
-async def get_current_user(
-    credentials: HTTPAuthorizationCredentials = Depends(security),
-    db: Session = Depends(get_db)
-) -> models.User:
-    """Get the current authenticated user from JWT token"""
-    credentials_exception = HTTPException(
+class CurrentUser(NamedTuple):
+    """Authenticated user as described by the JWT claims (no DB access needed)"""
+    id: int
+    username: str
+    is_active: bool
+
+
+def _credentials_exception() -> HTTPException:
+    return HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="No se pudo validar las credenciales",
         headers={"WWW-Authenticate": "Bearer"},
     )
-    
-    token = credentials.credentials
-    print(f"[AUTH] Token received: {token[:50]}..." if token else "[AUTH] No token")
-    
+
+
+def _inactive_exception() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_403_FORBIDDEN,
+        detail="Usuario desactivado"
+    )
+
+
+def _token_claims(token: str) -> Tuple[int, dict]:
+    """Validate a token and return (user_id, payload)"""
     payload = decode_token(token)
-    print(f"[AUTH] Payload decoded: {payload}")
-    
     if payload is None:
-        print("[AUTH] FAIL: payload is None")
-        raise credentials_exception
+        logger.debug("Auth failed: invalid token")
+        raise _credentials_exception()
     
     user_id_str = payload.get("sub")
-    print(f"[AUTH] User ID from payload: {user_id_str} (type: {type(user_id_str)})")
-    
     if user_id_str is None:
-        print("[AUTH] FAIL: user_id is None")
-        raise credentials_exception
+        logger.debug("Auth failed: token has no subject")
+        raise _credentials_exception()
     
     try:
         user_id = int(user_id_str)  # Convert back to int
     except (ValueError, TypeError):
-        print(f"[AUTH] FAIL: Cannot convert user_id to int: {user_id_str}")
-        raise credentials_exception
+        logger.debug("Auth failed: invalid user id %r", user_id_str)
+        raise _credentials_exception()
     
-    user = db.query(models.User).filter(models.User.id == user_id).first()
-    print(f"[AUTH] User found: {user}")
+    return user_id, payload
+
+
+def _load_user(db: Session, user_id: int) -> models.User:
+    """Load an active user by id or raise the matching auth error"""
+    user = db.execute(
+        select(models.User).where(models.User.id == user_id)
+    ).scalar_one_or_none()
     
     if user is None:
-        print("[AUTH] FAIL: user not found in DB")
-        raise credentials_exception
+        logger.debug("Auth failed: user %s not found", user_id)
+        raise _credentials_exception()
     
     if not user.is_active:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="Usuario desactivado"
-        )
+        raise _inactive_exception()
     
-    print(f"[AUTH] SUCCESS: User {user.username} authenticated")
     return user
 
 
+def _lookup_user_active(db: Session, user_id: int) -> bool:
+    """is_active for a user (cached briefly); 401 if the user no longer exists"""
+    row = db.execute(
+        select(models.User.is_active).where(models.User.id == user_id)
+    ).first()
+    if row is None:
+        logger.debug("Auth failed: user %s not found", user_id)
+        raise _credentials_exception()
+    
+    with _token_cache_lock:
+        _user_active_cache[user_id] = row.is_active
+    return row.is_active
+
+
+async def get_current_user(
+    credentials: HTTPAuthorizationCredentials = Depends(security),
+    db: Session = Depends(get_db)
+) -> CurrentUser:
+    """
+    Get the current authenticated user from the JWT claims.
+    The user's is_active flag is re-read from the DB at most every
+    USER_STATUS_TTL_SECONDS; tokens issued before the username/is_active
+    claims existed load the full row.
+    """
+    user_id, payload = _token_claims(credentials.credentials)
+    
+    # Blocking queries run in the threadpool to keep them off the event loop
+    if "u" not in payload or "a" not in payload:
+        user = await run_in_threadpool(_load_user, db, user_id)
+        return CurrentUser(id=user.id, username=user.username, is_active=user.is_active)
+    
+    with _token_cache_lock:
+        is_active = _user_active_cache.get(user_id)
+    if is_active is None:
+        is_active = await run_in_threadpool(_lookup_user_active, db, user_id)
+    if not is_active:
+        raise _inactive_exception()
+    
+    return CurrentUser(id=user_id, username=payload["u"], is_active=True)
+
+
+def get_current_user_db(
+    credentials: HTTPAuthorizationCredentials = Depends(security),
+    db: Session = Depends(get_db)
+) -> models.User:
+    """Get the current authenticated user as an ORM object (for routes needing the full row)"""
+    user_id, _ = _token_claims(credentials.credentials)
+    return _load_user(db, user_id)
+
+
 def register_user(db: Session, user_data: schemas.UserCreate) -> models.User:
     """Register a new user"""
     try:
-        # Check if email already exists
-        if db.query(models.User).filter(models.User.email == user_data.email).first():
+        # Check if email or username already exist in a single query
+        # (at most two distinct users can match, so limit(2) sees both conflicts)
+        existing = db.query(models.User.email, models.User.username).filter(
+            or_(
+                models.User.email == user_data.email,
+                models.User.username == user_data.username
+            )
+        ).limit(2).all()
+        
+        if any(row.email == user_data.email for row in existing):
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="El email ya está registrado"
             )
         
-        # Check if username already exists
-        if db.query(models.User).filter(models.User.username == user_data.username).first():
+        if existing:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="El nombre de usuario ya existe"
@@ -141,16 +231,17 @@ def register_user(db: Session, user_data: schemas.UserCreate) -> models.User:
         db.commit()
         db.refresh(db_user)
         
-        # Create default categories for the user
-        for cat_data in models.DEFAULT_CATEGORIES:
-            category = models.Category(
-                user_id=db_user.id,
-                name=cat_data["name"],
-                icon=cat_data["icon"],
-                color=cat_data["color"],
-                is_default=True
-            )
-            db.add(category)
+        # Create default categories for the user (one multi-row Core INSERT)
+        db.execute(insert(models.Category), [
+            {
+                "user_id": db_user.id,
+                "name": cat_data["name"],
+                "icon": cat_data["icon"],
+                "color": cat_data["color"],
+                "is_default": True,
+            }
+            for cat_data in models.DEFAULT_CATEGORIES
+        ])
         db.commit()
         
         return db_user
@@ -158,9 +249,7 @@ def register_user(db: Session, user_data: schemas.UserCreate) -> models.User:
     except HTTPException:
         raise
     except Exception as e:
-        print(f"[REGISTER ERROR] {str(e)}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("Error during registration")
         db.rollback()
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -187,7 +276,11 @@ def authenticate_user(db: Session, username: str, password: str) -> Optional[mod
 
 def create_user_token(user: models.User) -> schemas.Token:
     """Create a token response for a user"""
-    access_token = create_access_token(data={"sub": str(user.id)})  # Convert to string!
+    access_token = create_access_token(data={
+        "sub": str(user.id),  # Convert to string!
+        "u": user.username,
+        "a": user.is_active,
+    })
     return schemas.Token(
         access_token=access_token,
         token_type="bearer",
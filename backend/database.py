@@ -3,7 +3,7 @@ Database configuration for CardTrack
 Supports both local SQLite and Railway PostgreSQL
 """
 import os
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event, text
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 
@@ -14,11 +14,44 @@ DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./cardtrack.db")
 if DATABASE_URL.startswith("postgres://"):
     DATABASE_URL = DATABASE_URL.replace("postgres://", "postgresql://", 1)
 
+# Size of SQLAlchemy's compiled-statement cache (default is 500)
+QUERY_CACHE_SIZE = 1200
+
+# Connection pool settings (PostgreSQL); keeps warm connections across requests
+POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "20"))
+MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+POOL_RECYCLE_SECONDS = 1800
+POOL_TIMEOUT_SECONDS = 30
+
+# Advisory lock id serializing init_db across workers (PostgreSQL)
+INIT_DB_LOCK_KEY = 7310042
+
 # Create engine with appropriate settings
 if DATABASE_URL.startswith("sqlite"):
-    engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
+    engine = create_engine(
+        DATABASE_URL,
+        connect_args={"check_same_thread": False},
+        query_cache_size=QUERY_CACHE_SIZE
+    )
+
+    @event.listens_for(engine, "connect")
+    def _set_sqlite_pragmas(dbapi_connection, connection_record):
+        """Apply per-connection SQLite settings once, when the pool opens it"""
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute("PRAGMA cache_size=-64000")  # 64 MB
+        cursor.close()
 else:
-    engine = create_engine(DATABASE_URL)
+    engine = create_engine(
+        DATABASE_URL,
+        query_cache_size=QUERY_CACHE_SIZE,
+        pool_size=POOL_SIZE,
+        max_overflow=MAX_OVERFLOW,
+        pool_pre_ping=True,
+        pool_recycle=POOL_RECYCLE_SECONDS,
+        pool_timeout=POOL_TIMEOUT_SECONDS
+    )
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
@@ -36,4 +69,13 @@ def get_db():
 def init_db():
     """Initialize database tables"""
     from . import models  # noqa
-    Base.metadata.create_all(bind=engine)
+    with engine.begin() as conn:
+        if conn.dialect.name == "postgresql":
+            # Every uvicorn worker runs startup; let one create the schema at a time
+            conn.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": INIT_DB_LOCK_KEY})
+        Base.metadata.create_all(bind=conn)
+        
+        # create_all skips existing tables, so add any indexes introduced since
+        for table in Base.metadata.sorted_tables:
+            for index in table.indexes:
+                index.create(bind=conn, checkfirst=True)
@@ -2,19 +2,28 @@
 CardTrack - Main FastAPI Application
 Full-stack expense tracking with authentication, categories, and analytics
 """
+import io
 import os
+import hashlib
+import logging
 import random
 from datetime import datetime, timedelta
 from typing import List, Optional
-from fastapi import FastAPI, Depends, HTTPException, status, UploadFile, File, Query, Form
+from fastapi import FastAPI, Depends, HTTPException, status, UploadFile, File, Query, Form, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
-from sqlalchemy.orm import Session
+from fastapi.responses import Response
+from sqlalchemy import insert, update, delete, tuple_
+from sqlalchemy.orm import Session, selectinload, contains_eager
 
 from . import models, schemas, auth, analytics
 from .database import get_db, init_db, engine
 
+# App-level logging; keep at WARNING in production, DEBUG for troubleshooting
+logging.basicConfig(level=os.getenv("LOG_LEVEL", "WARNING").upper())
+logger = logging.getLogger(__name__)
+
 # Create FastAPI app
 app = FastAPI(
     title="CardTrack API",
@@ -22,14 +31,72 @@ app = FastAPI(
     version="1.0.0"
 )
 
-# CORS middleware for frontend
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],  # In production, specify your domain
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
+# CORS middleware for frontends on other origins; the bundled frontend is
+# served from this app (same origin) and doesn't need it
+CORS_ORIGINS = [
+    origin.strip()
+    for origin in os.getenv("CORS_ORIGINS", "http://localhost:8000,http://127.0.0.1:8000").split(",")
+    if origin.strip()
+]
+if CORS_ORIGINS:
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=CORS_ORIGINS,
+        allow_credentials=True,
+        allow_methods=["GET", "POST", "PUT", "PATCH", "DELETE"],
+        allow_headers=["Authorization", "Content-Type", "If-None-Match"],
+        expose_headers=["ETag", "X-Next-After-Date", "X-Next-After-Id"],
+    )
+
+# ETag for API JSON responses; the SPA re-fetches these on every refresh
+ETAG_CACHE_CONTROL = "private, must-revalidate"
+ETAG_SKIP_PATHS = ("/api/upload",)
+
+
+@app.middleware("http")
+async def etag_middleware(request: Request, call_next):
+    """Answer 304 Not Modified when a GET /api/ payload matches If-None-Match"""
+    response = await call_next(request)
+    path = request.url.path
+    if (
+        request.method != "GET"
+        or not path.startswith("/api/")
+        or path in ETAG_SKIP_PATHS
+        or response.status_code != 200
+        or not response.headers.get("content-type", "").startswith("application/json")
+    ):
+        return response
+
+    body = b"".join([chunk async for chunk in response.body_iterator])
+    # Weak: GZipMiddleware (outside this one) may compress the body, and the
+    # gzip and identity encodings share this tag
+    opaque_tag = f'"{hashlib.blake2b(body, digest_size=16).hexdigest()}"'
+    etag = f"W/{opaque_tag}"
+    cache_control = response.headers.get("cache-control", ETAG_CACHE_CONTROL)
+    # raw_headers keeps repeated headers (e.g. several Set-Cookie) intact
+    raw_headers = [
+        (key, value) for key, value in response.raw_headers
+        if key not in (b"etag", b"cache-control", b"content-length")
+    ]
+    validators = [(b"etag", etag.encode("latin-1")), (b"cache-control", cache_control.encode("latin-1"))]
+
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and opaque_tag in (t.strip().removeprefix("W/") for t in if_none_match.split(",")):
+        # A 304 must repeat Vary, and keep the CORS headers so caches and
+        # browsers treat it like the 200 it stands for
+        not_modified = Response(status_code=304)
+        not_modified.raw_headers = [
+            (key, value) for key, value in raw_headers
+            if key == b"vary" or key.startswith(b"access-control-")
+        ] + validators
+        return not_modified
+
+    fresh = Response(content=body, status_code=response.status_code)
+    fresh.raw_headers = raw_headers + [(b"content-length", str(len(body)).encode("latin-1"))] + validators
+    return fresh
+
+# Compress JSON and frontend assets (transaction lists, app.js, styles.css)
+app.add_middleware(GZipMiddleware, minimum_size=500, compresslevel=5)
 
 # Initialize database on startup
 @app.on_event("startup")
@@ -41,47 +108,68 @@ def startup_event():
 
 # Mount static files (frontend)
 frontend_path = os.path.join(os.path.dirname(os.path.dirname(__file__)))
+frontend_files = StaticFiles(directory=frontend_path, check_dir=False)
 if os.path.exists(os.path.join(frontend_path, "index.html")):
-    app.mount("/static", StaticFiles(directory=frontend_path), name="static")
+    app.mount("/static", frontend_files, name="static")
+
+# Filenames aren't fingerprinted, so let browsers keep a copy but revalidate
+# it every time; ETag/Last-Modified turn repeat loads into 304s.
+FRONTEND_CACHE_CONTROL = "no-cache"
+
+
+async def serve_frontend_file(request: Request, filename: str):
+    """Serve a frontend file with validators, answering 304 when unchanged"""
+    response = await frontend_files.get_response(filename, request.scope)
+    response.headers["Cache-Control"] = FRONTEND_CACHE_CONTROL
+    return response
 
 
 @app.get("/", include_in_schema=False)
-async def root():
+async def root(request: Request):
     """Serve the frontend"""
-    index_path = os.path.join(frontend_path, "index.html")
-    if os.path.exists(index_path):
-        return FileResponse(index_path)
+    if os.path.exists(os.path.join(frontend_path, "index.html")):
+        return await serve_frontend_file(request, "index.html")
     return {"message": "CardTrack API", "docs": "/docs"}
 
 @app.get("/styles.css", include_in_schema=False)
-async def styles():
-    return FileResponse(os.path.join(frontend_path, "styles.css"))
+async def styles(request: Request):
+    return await serve_frontend_file(request, "styles.css")
 
 @app.get("/app.js", include_in_schema=False)
-async def app_js():
-    return FileResponse(os.path.join(frontend_path, "app.js"))
+async def app_js(request: Request):
+    return await serve_frontend_file(request, "app.js")
 
 
 
+# ============ Helpers ============
+
+def owned(db: Session, model, id_: int, user_id: int, detail: str = "No encontrado", options=()):
+    """Load a row by primary key and check it belongs to the user, else 404"""
+    obj = db.get(model, id_, options=options)
+    if obj is None or obj.user_id != user_id:
+        raise HTTPException(status_code=404, detail=detail)
+    return obj
+
+
 # ============ Health Check ============
 
 @app.get("/api/health")
 async def health_check():
     """Health check endpoint for Railway"""
-    return {"status": "healthy", "timestamp": datetime.utcnow().isoformat()}
+    return {"status": "healthy", "timestamp": models.utcnow().isoformat()}
 
 
 # ============ Authentication Endpoints ============
 
 @app.post("/api/auth/register", response_model=schemas.Token)
-async def register(user_data: schemas.UserCreate, db: Session = Depends(get_db)):
+def register(user_data: schemas.UserCreate, db: Session = Depends(get_db)):
     """Register a new user"""
     user = auth.register_user(db, user_data)
     return auth.create_user_token(user)
 
 
 @app.post("/api/auth/login", response_model=schemas.Token)
-async def login(credentials: schemas.UserLogin, db: Session = Depends(get_db)):
+def login(credentials: schemas.UserLogin, db: Session = Depends(get_db)):
     """Login and get access token"""
     user = auth.authenticate_user(db, credentials.username, credentials.password)
     if not user:
@@ -94,7 +182,7 @@ async def login(credentials: schemas.UserLogin, db: Session = Depends(get_db)):
 
 @app.get("/api/auth/me", response_model=schemas.UserResponse)
 async def get_current_user_info(
-    current_user: models.User = Depends(auth.get_current_user)
+    current_user: models.User = Depends(auth.get_current_user_db)
 ):
     """Get current user info"""
     return current_user
@@ -103,8 +191,8 @@ async def get_current_user_info(
 # ============ Category Endpoints ============
 
 @app.get("/api/categories", response_model=List[schemas.CategoryResponse])
-async def get_categories(
-    current_user: models.User = Depends(auth.get_current_user),
+def get_categories(
+    current_user: auth.CurrentUser = Depends(auth.get_current_user),
     db: Session = Depends(get_db)
 ):
     """Get all categories for the current user"""
@@ -115,9 +203,9 @@ async def get_categories(
 
 
 @app.post("/api/categories", response_model=schemas.CategoryResponse)
-async def create_category(
+def create_category(
     category_data: schemas.CategoryCreate,
-    current_user: models.User = Depends(auth.get_current_user),
+    current_user: auth.CurrentUser = Depends(auth.get_current_user),
     db: Session = Depends(get_db)
 ):
     """Create a new category"""
@@ -135,20 +223,14 @@ async def create_category(
 
 
 @app.put("/api/categories/{category_id}", response_model=schemas.CategoryResponse)
-async def update_category(
+def update_category(
     category_id: int,
     category_data: schemas.CategoryUpdate,
-    current_user: models.User = Depends(auth.get_current_user),
+    current_user: auth.CurrentUser = Depends(auth.get_current_user),
     db: Session = Depends(get_db)
 ):
     """Update a category"""
-    category = db.query(models.Category).filter(
-        models.Category.id == category_id,
-        models.Category.user_id == current_user.id
-    ).first()
-    
-    if not category:
-        raise HTTPException(status_code=404, detail="Categoría no encontrada")
+    category = owned(db, models.Category, category_id, current_user.id, "Categoría no encontrada")
     
     if category_data.name is not None:
         category.name = category_data.name
@@ -163,26 +245,30 @@ async def update_category(
 
 
 @app.delete("/api/categories/{category_id}")
-async def delete_category(
+def delete_category(
     category_id: int,
-    current_user: models.User = Depends(auth.get_current_user),
+    current_user: auth.CurrentUser = Depends(auth.get_current_user),
     db: Session = Depends(get_db)
 ):
     """Delete a category (transactions will have null category)"""
-    category = db.query(models.Category).filter(
-        models.Category.id == category_id,
-        models.Category.user_id == current_user.id
-    ).first()
-    
-    if not category:
-        raise HTTPException(status_code=404, detail="Categoría no encontrada")
-    
-    # Set transactions to null category
-    db.query(models.Transaction).filter(
-        models.Transaction.category_id == category_id
-    ).update({"category_id": None})
-    
-    db.delete(category)
+    owned(db, models.Category, category_id, current_user.id, "Categoría no encontrada")
+    
+    # Set transactions to null category and drop the category in one transaction;
+    # nothing in the session needs syncing, so skip the ORM bookkeeping
+    db.execute(
+        update(models.Transaction)
+        .where(
+            models.Transaction.user_id == current_user.id,
+            models.Transaction.category_id == category_id
+        )
+        .values(category_id=None)
+        .execution_options(synchronize_session=False)
+    )
+    db.execute(
+        delete(models.Category)
+        .where(models.Category.id == category_id)
+        .execution_options(synchronize_session=False)
+    )
     db.commit()
     return {"message": "Categoría eliminada"}
 
@@ -190,8 +276,9 @@ async def delete_category(
 # ============ Transaction Endpoints ============
 
 @app.get("/api/transactions", response_model=List[schemas.TransactionResponse])
-async def get_transactions(
-    current_user: models.User = Depends(auth.get_current_user),
+def get_transactions(
+    response: Response,
+    current_user: auth.CurrentUser = Depends(auth.get_current_user),
     db: Session = Depends(get_db),
     category_id: Optional[int] = Query(None),
     search: Optional[str] = Query(None),
@@ -199,13 +286,38 @@ async def get_transactions(
     month: Optional[int] = Query(None, ge=1, le=12),
     year: Optional[int] = Query(None, ge=2020, le=2030),
     limit: int = Query(100, le=500),
-    offset: int = Query(0)
+    offset: int = Query(0),
+    after_date: Optional[datetime] = Query(None, description="Keyset cursor: date of the last row seen"),
+    after_id: Optional[int] = Query(None, description="Keyset cursor: id of the last row seen")
 ):
-    """Get transactions with optional filters"""
+    """
+    Get transactions with optional filters.
+    
+    Pages with a keyset cursor when after_date and after_id are given together
+    (use the X-Next-After-Date / X-Next-After-Id response headers); offset
+    paging still works, but not combined with a cursor.
+    """
+    has_cursor = after_date is not None or after_id is not None
+    if has_cursor and (after_date is None or after_id is None):
+        raise HTTPException(
+            status_code=422,  # UNPROCESSABLE_CONTENT; the constant was renamed across Starlette versions
+            detail="after_date y after_id deben enviarse juntos"
+        )
+    if has_cursor and offset:
+        raise HTTPException(
+            status_code=422,
+            detail="No se puede combinar offset con after_date/after_id"
+        )
+    
     query = db.query(models.Transaction).filter(
         models.Transaction.user_id == current_user.id
     )
     
+    if has_cursor:
+        query = query.filter(
+            tuple_(models.Transaction.date, models.Transaction.id) < tuple_(after_date, after_id)
+        )
+    
     if category_id:
         query = query.filter(models.Transaction.category_id == category_id)
     
@@ -216,29 +328,41 @@ async def get_transactions(
         query = query.filter(models.Transaction.is_dollar == is_dollar)
     
     if month and year:
-        query = query.join(models.Statement).filter(
+        query = query.join(models.Transaction.statement).filter(
             models.Statement.month == month,
             models.Statement.year == year
-        )
+        ).options(contains_eager(models.Transaction.statement))
     elif year:
-        query = query.join(models.Statement).filter(
+        query = query.join(models.Transaction.statement).filter(
             models.Statement.year == year
-        )
+        ).options(contains_eager(models.Transaction.statement))
     
     transactions = query.order_by(
-        models.Transaction.date.desc()
+        models.Transaction.date.desc(),
+        models.Transaction.id.desc()
     ).offset(offset).limit(limit).all()
     
+    # A full page may have more rows after it (limit=0 returns an empty page, no cursor)
+    if transactions and len(transactions) == limit:
+        last = transactions[-1]
+        response.headers["X-Next-After-Date"] = last.date.isoformat()
+        response.headers["X-Next-After-Id"] = str(last.id)
+    
     return transactions
 
 
 @app.post("/api/transactions", response_model=schemas.TransactionResponse)
-async def create_transaction(
+def create_transaction(
     transaction_data: schemas.TransactionCreate,
-    current_user: models.User = Depends(auth.get_current_user),
+    current_user: auth.CurrentUser = Depends(auth.get_current_user),
     db: Session = Depends(get_db)
 ):
     """Create a new transaction"""
+    # Only the user's own categories; delete_category relies on it when it
+    # detaches just this user's transactions
+    if transaction_data.category_id is not None:
+        owned(db, models.Category, transaction_data.category_id, current_user.id, "Categoría no encontrada")
+    
     transaction = models.Transaction(
         user_id=current_user.id,
         category_id=transaction_data.category_id,
@@ -253,32 +377,25 @@ async def create_transaction(
     return transaction
 
 
-@app.put("/api/transactions/{transaction_id}", response_model=schemas.TransactionResponse)
-async def update_transaction(
+@app.api_route("/api/transactions/{transaction_id}", methods=["PUT", "PATCH"], response_model=schemas.TransactionResponse)
+def update_transaction(
     transaction_id: int,
-    transaction_data: schemas.TransactionUpdate,
-    current_user: models.User = Depends(auth.get_current_user),
+    transaction_update: schemas.TransactionUpdate,
+    current_user: auth.CurrentUser = Depends(auth.get_current_user),
     db: Session = Depends(get_db)
 ):
-    """Update a transaction"""
-    transaction = db.query(models.Transaction).filter(
-        models.Transaction.id == transaction_id,
-        models.Transaction.user_id == current_user.id
-    ).first()
+    """Update a transaction (e.g. modify category); PUT and PATCH both apply only the fields sent"""
+    transaction = owned(db, models.Transaction, transaction_id, current_user.id, "Transacción no encontrada")
     
-    if not transaction:
-        raise HTTPException(status_code=404, detail="Transacción no encontrada")
+    # Update fields
+    update_data = transaction_update.model_dump(exclude_unset=True)
     
-    if transaction_data.merchant is not None:
-        transaction.merchant = transaction_data.merchant
-    if transaction_data.amount is not None:
-        transaction.amount = transaction_data.amount
-    if transaction_data.date is not None:
-        transaction.date = transaction_data.date
-    if transaction_data.category_id is not None:
-        transaction.category_id = transaction_data.category_id
-    if transaction_data.description is not None:
-        transaction.description = transaction_data.description
+    # Validate category if changing
+    if "category_id" in update_data and update_data["category_id"] is not None:
+        owned(db, models.Category, update_data["category_id"], current_user.id, "Categoría no encontrada")
+    
+    for key, value in update_data.items():
+        setattr(transaction, key, value)
     
     db.commit()
     db.refresh(transaction)
@@ -286,19 +403,13 @@ async def update_transaction(
 
 
 @app.delete("/api/transactions/{transaction_id}")
-async def delete_transaction(
+def delete_transaction(
     transaction_id: int,
-    current_user: models.User = Depends(auth.get_current_user),
+    current_user: auth.CurrentUser = Depends(auth.get_current_user),
     db: Session = Depends(get_db)
 ):
     """Delete a transaction"""
-    transaction = db.query(models.Transaction).filter(
-        models.Transaction.id == transaction_id,
-        models.Transaction.user_id == current_user.id
-    ).first()
-    
-    if not transaction:
-        raise HTTPException(status_code=404, detail="Transacción no encontrada")
+    transaction = owned(db, models.Transaction, transaction_id, current_user.id, "Transacción no encontrada")
     
     db.delete(transaction)
     db.commit()
@@ -308,8 +419,8 @@ async def delete_transaction(
 # ============ Analytics Endpoints ============
 
 @app.get("/api/analytics", response_model=schemas.AnalyticsResponse)
-async def get_analytics_data(
-    current_user: models.User = Depends(auth.get_current_user),
+def get_analytics_data(
+    current_user: auth.CurrentUser = Depends(auth.get_current_user),
     db: Session = Depends(get_db),
     period: str = Query("month", pattern="^(month|quarter|year)$"),
     is_dollar: Optional[bool] = Query(None, description="True for USD, False for ARS, None for all"),
@@ -320,9 +431,9 @@ async def get_analytics_data(
     return analytics.get_analytics(db, current_user.id, period, is_dollar, month, year)
 
 
-@app.get("/api/analytics/trend")
-async def get_spending_trend(
-    current_user: models.User = Depends(auth.get_current_user),
+@app.get("/api/analytics/trend", response_model=List[schemas.TrendPoint])
+def get_spending_trend(
+    current_user: auth.CurrentUser = Depends(auth.get_current_user),
     db: Session = Depends(get_db),
     period: str = Query("month", pattern="^(month|quarter|year)$"),
     is_dollar: Optional[bool] = Query(None, description="True for USD, False for ARS, None for all"),
@@ -333,73 +444,54 @@ async def get_spending_trend(
     return analytics.get_spending_trend(db, current_user.id, period, is_dollar, month, year)
 
 
-@app.get("/api/available-periods")
-async def get_available_periods(
-    current_user: models.User = Depends(auth.get_current_user),
+# Periods only change on upload/delete; the app re-fetches them right after an
+# upload, so have the browser revalidate (cheap 304 via ETag) rather than
+# reuse a stale copy for a fixed max-age.
+PERIODS_CACHE_CONTROL = "private, no-cache"
+
+
+@app.get("/api/available-periods", response_model=schemas.AvailablePeriods)
+def get_available_periods(
+    response: Response,
+    current_user: auth.CurrentUser = Depends(auth.get_current_user),
     db: Session = Depends(get_db)
 ):
     """Get available months and years that have statement data"""
+    response.headers["Cache-Control"] = PERIODS_CACHE_CONTROL
     return analytics.get_available_periods(db, current_user.id)
 
 
 # ============ File Upload Endpoint ============
 
-# Merchant name patterns for auto-categorization
-CATEGORY_KEYWORDS = {
-    "Comida y Restaurantes": ["restaurant", "cafe", "coffee", "food", "pizza", "burger", "sushi", "starbucks", "mcdonalds", "uber eats", "pedidosya", "rappi", "supermercado", "carrefour", "coto", "dia"],
-    "Compras": ["amazon", "mercadolibre", "store", "shop", "mall", "clothing", "fashion", "nike", "adidas", "zara", "tienda"],
-    "Transporte": ["uber", "cabify", "taxi", "subte", "sube", "ypf", "shell", "axion", "estacionamiento", "peaje"],
-    "Entretenimiento": ["netflix", "spotify", "hulu", "disney", "cine", "cinema", "concert", "ticket", "steam", "playstation", "xbox"],
-    "Servicios": ["edenor", "edesur", "metrogas", "aysa", "telecom", "personal", "movistar", "claro", "fibertel"],
-    "Salud": ["farmacia", "farmacity", "doctor", "hospital", "clinica", "gym", "gimnasio", "megatlon"],
-    "Suscripciones": ["subscription", "mensual", "apple", "google", "microsoft", "adobe", "amazon prime"]
-}
-
-
-def auto_categorize(merchant: str, categories: List[models.Category]) -> Optional[int]:
-    """Auto-categorize a transaction based on merchant name"""
-    merchant_lower = merchant.lower()
-    
-    for cat in categories:
-        cat_name = cat.name
-        if cat_name in CATEGORY_KEYWORDS:
-            keywords = CATEGORY_KEYWORDS[cat_name]
-            if any(keyword in merchant_lower for keyword in keywords):
-                return cat.id
-    
-    # Default to "Otros" if exists
-    otros = next((c for c in categories if "otro" in c.name.lower()), None)
-    return otros.id if otros else None
-
-
 @app.post("/api/upload", response_model=schemas.UploadResponse)
-async def upload_statement(
+def upload_statement(
     file: UploadFile = File(...),
     dolar_rate: float = Form(0.0, description="Cotización dólar tarjeta (oficial + 30%)"),
-    current_user: models.User = Depends(auth.get_current_user),
+    current_user: auth.CurrentUser = Depends(auth.get_current_user),
     db: Session = Depends(get_db)
 ):
     """
     Upload and process a credit card statement (PDF).
     Parses Mastercard Argentina statements and extracts real transactions.
     """
-    import tempfile
-    import shutil
-    from .pdf_parser import parse_mastercard_pdf, get_category_for_merchant
+    from .pdf_parser import parse_mastercard_pdf, get_category_for_merchant, to_insert_rows
     
     # Get user's categories
     categories = db.query(models.Category).filter(
         models.Category.user_id == current_user.id
     ).all()
     
-    # Create a category lookup dict
+    # Create category lookups once instead of re-scanning per transaction
     category_lookup = {c.name.lower(): c for c in categories}
+    otros_category = next((c for c in categories if "otro" in c.name.lower()), None)
+    suscripciones_category = next((c for c in categories if "suscripcion" in c.name.lower()), None)
+    resolved_categories = {}  # parser category name -> user category
     
     # Check if it's a PDF
     if not file.filename.lower().endswith('.pdf'):
         # For non-PDF files, use the old mock behavior for now
-        transactions = []
-        now = datetime.utcnow()
+        rows = []
+        now = models.utcnow()
         total_amount = 0
         
         sample_merchants = [
@@ -413,41 +505,33 @@ async def upload_statement(
             amount = round(random.uniform(1000, 10000), 2)
             total_amount += amount
             
-            transaction = models.Transaction(
+            rows.append(dict(
                 user_id=current_user.id,
                 category_id=category.id if category else None,
                 merchant=f"{merchant} {i+1}",
                 amount=amount,
                 date=now - timedelta(days=random.randint(0, 30))
-            )
-            db.add(transaction)
-            transactions.append(transaction)
+            ))
         
+        db.execute(insert(models.Transaction), rows)
         db.commit()
         
         return schemas.UploadResponse(
             filename=file.filename,
-            transactions_imported=len(transactions),
+            transactions_imported=len(rows),
             total_amount=round(total_amount, 2)
         )
     
-    # Save PDF to temp file
     try:
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.pdf') as tmp:
-            shutil.copyfileobj(file.file, tmp)
-            tmp_path = tmp.name
-        
-        print(f"[Upload] Saved PDF to: {tmp_path}")
-        
-        # Parse the PDF
-        statement_data = parse_mastercard_pdf(tmp_path)
+        # Parse the PDF straight from memory; this handler runs in the threadpool
+        statement_data = parse_mastercard_pdf(io.BytesIO(file.file.read()))
         
         # Create Statement record
         statement = models.Statement(
             user_id=current_user.id,
             filename=file.filename,
-            month=statement_data.month or datetime.utcnow().month,
-            year=statement_data.year or datetime.utcnow().year,
+            month=statement_data.month or models.utcnow().month,
+            year=statement_data.year or models.utcnow().year,
             total_pesos=statement_data.saldo_actual_pesos,
             total_dollars=statement_data.saldo_actual_dolares,
             dolar_rate=dolar_rate,
@@ -458,139 +542,93 @@ async def upload_statement(
         db.add(statement)
         db.flush()  # Get the statement ID
         
-        # Create transactions from parsed data
-        transactions_created = []
-        total_pesos = 0
-        total_dollars = 0
-        
-        for t in statement_data.transactions:
+        def category_id_for(t, is_dollar):
             # Get or create category based on merchant name
             cat_name = get_category_for_merchant(t.merchant)
-            category = category_lookup.get(cat_name.lower())
-            
-            if not category:
-                category = next(
-                    (c for c in categories if cat_name.lower() in c.name.lower()),
-                    next((c for c in categories if "otro" in c.name.lower()), None)
+            if cat_name not in resolved_categories:
+                key = cat_name.lower()
+                resolved_categories[cat_name] = category_lookup.get(key) or next(
+                    (c for c in categories if key in c.name.lower()),
+                    otros_category
                 )
-            
-            # Import both PESOS and USD transactions
-            if t.amount_pesos != 0:
-                total_pesos += t.amount_pesos
-                transaction = models.Transaction(
-                    user_id=current_user.id,
-                    statement_id=statement.id,
-                    category_id=category.id if category else None,
-                    merchant=t.merchant,
-                    amount=abs(t.amount_pesos),
-                    is_dollar=False,
-                    date=t.date,
-                    description=f"Cupón: {t.coupon_number}" if t.coupon_number else None
-                )
-                db.add(transaction)
-                transactions_created.append(transaction)
-            
-            if t.amount_dollars != 0:
-                total_dollars += t.amount_dollars
+            category = resolved_categories[cat_name]
+            if is_dollar:
                 # Categorize USD transactions as Suscripciones by default
-                usd_category = next(
-                    (c for c in categories if "suscripcion" in c.name.lower()),
-                    category
-                )
-                transaction = models.Transaction(
-                    user_id=current_user.id,
-                    statement_id=statement.id,
-                    category_id=usd_category.id if usd_category else None,
-                    merchant=t.merchant,
-                    amount=abs(t.amount_dollars),
-                    is_dollar=True,
-                    date=t.date,
-                    description=f"Cupón: {t.coupon_number}" if t.coupon_number else None
-                )
-                db.add(transaction)
-                transactions_created.append(transaction)
+                category = suscripciones_category or category
+            return category.id if category else None
+        
+        # Import both PESOS and USD transactions (bulk-inserted below)
+        rows = to_insert_rows(statement_data, current_user.id, statement.id, category_id_for)
         
         # Add impuestos as a separate transaction if significant
         if abs(statement_data.impuestos_pesos) > 100:
             impuestos_category = next(
                 (c for c in categories if "impuesto" in c.name.lower() or "servicio" in c.name.lower()),
-                next((c for c in categories if "otro" in c.name.lower()), None)
+                otros_category
             )
             
-            impuestos_transaction = models.Transaction(
+            rows.append(dict(
                 user_id=current_user.id,
                 statement_id=statement.id,
                 category_id=impuestos_category.id if impuestos_category else None,
                 merchant="Impuestos y Cargos del Resumen",
                 amount=abs(statement_data.impuestos_pesos),
                 is_dollar=False,
-                date=statement_data.statement_date or datetime.utcnow(),
+                date=statement_data.statement_date or models.utcnow(),
                 description="Calculado automáticamente (diferencia entre saldo y transacciones)"
-            )
-            db.add(impuestos_transaction)
-            transactions_created.append(impuestos_transaction)
-            total_pesos += abs(statement_data.impuestos_pesos)
+            ))
         
         # Add saldo pendiente (previous month balance) as a separate transaction if significant
         if abs(statement_data.saldo_pendiente_pesos) > 100:
-            saldo_pendiente_category = next(
-                (c for c in categories if "otro" in c.name.lower()),
-                None
-            )
+            saldo_pendiente_category = otros_category
             
-            saldo_pendiente_transaction = models.Transaction(
+            rows.append(dict(
                 user_id=current_user.id,
                 statement_id=statement.id,
                 category_id=saldo_pendiente_category.id if saldo_pendiente_category else None,
                 merchant="Saldo Pendiente (Mes Anterior)",
                 amount=abs(statement_data.saldo_pendiente_pesos),
                 is_dollar=False,
-                date=statement_data.statement_date or datetime.utcnow(),
+                date=statement_data.statement_date or models.utcnow(),
                 description="Saldo impago del mes anterior que se arrastra a este resumen"
-            )
-            db.add(saldo_pendiente_transaction)
-            transactions_created.append(saldo_pendiente_transaction)
-            total_pesos += abs(statement_data.saldo_pendiente_pesos)
+            ))
         
         # Same for USD saldo pendiente
         if abs(statement_data.saldo_pendiente_dolares) > 1:
-            saldo_pendiente_usd_category = next(
-                (c for c in categories if "otro" in c.name.lower()),
-                None
-            )
+            saldo_pendiente_usd_category = otros_category
             
-            saldo_pendiente_usd_transaction = models.Transaction(
+            rows.append(dict(
                 user_id=current_user.id,
                 statement_id=statement.id,
                 category_id=saldo_pendiente_usd_category.id if saldo_pendiente_usd_category else None,
                 merchant="Saldo Pendiente USD (Mes Anterior)",
                 amount=abs(statement_data.saldo_pendiente_dolares),
                 is_dollar=True,
-                date=statement_data.statement_date or datetime.utcnow(),
+                date=statement_data.statement_date or models.utcnow(),
                 description="Saldo en dólares impago del mes anterior"
-            )
-            db.add(saldo_pendiente_usd_transaction)
-            transactions_created.append(saldo_pendiente_usd_transaction)
-            total_dollars += abs(statement_data.saldo_pendiente_dolares)
+            ))
         
         # Update statement transaction count
-        statement.transaction_count = len(transactions_created)
+        statement.transaction_count = len(rows)
         
-        db.commit()
+        # Keep the default synchronous commit: the response hands back a
+        # statement_id, and uploads aren't deduplicated, so a commit lost after
+        # returning 200 would go unnoticed (skipping one WAL fsync isn't worth it)
+        if rows:
+            db.execute(insert(models.Transaction), rows)
         
-        # Clean up temp file
-        import os
-        try:
-            os.unlink(tmp_path)
-        except:
-            pass
+        db.commit()
+        analytics.invalidate_user_cache(current_user.id)
         
-        print(f"[Upload] Created statement ID {statement.id} with {len(transactions_created)} transactions")
-        print(f"[Upload] Total PESOS: ${total_pesos:,.2f}, Total USD: ${total_dollars:.2f}")
+        logger.info(
+            "Upload: created statement %s with %d transactions (parsed $%.2f pesos / U$S %.2f)",
+            statement.id, len(rows),
+            statement_data.total_transactions_pesos, statement_data.total_transactions_dolares
+        )
         
         return schemas.UploadResponse(
             filename=file.filename,
-            transactions_imported=len(transactions_created),
+            transactions_imported=len(rows),
             total_amount=round(statement_data.saldo_actual_pesos, 2),
             statement_id=statement.id
         )
@@ -598,9 +636,7 @@ async def upload_statement(
     except HTTPException:
         raise
     except Exception as e:
-        print(f"[Upload Error] {str(e)}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("Error processing upload %s", file.filename)
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Error procesando PDF: {str(e)}"
@@ -610,8 +646,8 @@ async def upload_statement(
 # ============ Statement Endpoints ============
 
 @app.get("/api/statements", response_model=List[schemas.StatementResponse])
-async def get_statements(
-    current_user: models.User = Depends(auth.get_current_user),
+def get_statements(
+    current_user: auth.CurrentUser = Depends(auth.get_current_user),
     db: Session = Depends(get_db)
 ):
     """Get all statements for current user, ordered by date descending"""
@@ -623,14 +659,12 @@ async def get_statements(
 
 
 @app.get("/api/statements/latest-dates", response_model=schemas.LatestStatementDates)
-async def get_latest_statement_dates(
-    current_user: models.User = Depends(auth.get_current_user),
+def get_latest_statement_dates(
+    current_user: auth.CurrentUser = Depends(auth.get_current_user),
     db: Session = Depends(get_db)
 ):
     """Get próximo cierre and vencimiento from the most recent statement"""
-    statement = db.query(models.Statement).filter(
-        models.Statement.user_id == current_user.id
-    ).order_by(models.Statement.year.desc(), models.Statement.month.desc()).first()
+    statement = analytics.get_latest_statement(db, current_user.id)
     
     if not statement:
         return schemas.LatestStatementDates()
@@ -644,50 +678,40 @@ async def get_latest_statement_dates(
 
 
 @app.get("/api/statements/{statement_id}", response_model=schemas.StatementWithTransactions)
-async def get_statement(
+def get_statement(
     statement_id: int,
-    current_user: models.User = Depends(auth.get_current_user),
+    current_user: auth.CurrentUser = Depends(auth.get_current_user),
     db: Session = Depends(get_db)
 ):
     """Get a specific statement with its transactions"""
-    statement = db.query(models.Statement).filter(
-        models.Statement.id == statement_id,
-        models.Statement.user_id == current_user.id
-    ).first()
-    
-    if not statement:
-        raise HTTPException(status_code=404, detail="Resumen no encontrado")
-    
-    return statement
+    return owned(
+        db, models.Statement, statement_id, current_user.id, "Resumen no encontrado",
+        options=[selectinload(models.Statement.transactions)]
+    )
 
 
 @app.delete("/api/statements/{statement_id}")
-async def delete_statement(
+def delete_statement(
     statement_id: int,
-    current_user: models.User = Depends(auth.get_current_user),
+    current_user: auth.CurrentUser = Depends(auth.get_current_user),
     db: Session = Depends(get_db)
 ):
     """Delete a statement and all its transactions"""
-    statement = db.query(models.Statement).filter(
-        models.Statement.id == statement_id,
-        models.Statement.user_id == current_user.id
-    ).first()
-    
-    if not statement:
-        raise HTTPException(status_code=404, detail="Resumen no encontrado")
+    statement = owned(db, models.Statement, statement_id, current_user.id, "Resumen no encontrado")
     
     # Delete the statement (transactions will cascade delete)
     db.delete(statement)
     db.commit()
+    analytics.invalidate_user_cache(current_user.id)
     
     return {"message": f"Resumen de {statement.month}/{statement.year} eliminado con {statement.transaction_count} transacciones"}
 
 
 @app.get("/api/transactions/by-statement/{statement_id}", response_model=List[schemas.TransactionResponse])
-async def get_transactions_by_statement(
+def get_transactions_by_statement(
     statement_id: int,
     is_dollar: Optional[bool] = Query(None, description="Filter by currency"),
-    current_user: models.User = Depends(auth.get_current_user),
+    current_user: auth.CurrentUser = Depends(auth.get_current_user),
     db: Session = Depends(get_db)
 ):
     """Get transactions for a specific statement, optionally filtered by currency"""
@@ -700,48 +724,3 @@ async def get_transactions_by_statement(
         query = query.filter(models.Transaction.is_dollar == is_dollar)
     
     return query.order_by(models.Transaction.date.desc()).all()
-
-
-@app.patch("/api/transactions/{transaction_id}", response_model=schemas.TransactionResponse)
-async def update_transaction(
-    transaction_id: int,
-    transaction_update: schemas.TransactionUpdate,
-    current_user: models.User = Depends(auth.get_current_user),
-    db: Session = Depends(get_db)
-):
-    """Update a transaction (e.g. modify category)"""
-    transaction = db.query(models.Transaction).filter(
-        models.Transaction.id == transaction_id,
-        models.Transaction.user_id == current_user.id
-    ).first()
-    
-    if not transaction:
-        raise HTTPException(status_code=404, detail="Transacción no encontrada")
-    
-    # Update fields
-    update_data = transaction_update.dict(exclude_unset=True)
-    
-    # Validate category if changing
-    if "category_id" in update_data and update_data["category_id"] is not None:
-        category = db.query(models.Category).filter(
-            models.Category.id == update_data["category_id"],
-            models.Category.user_id == current_user.id
-        ).first()
-        if not category:
-            raise HTTPException(status_code=404, detail="Categoría no encontrada")
-            
-    for key, value in update_data.items():
-        setattr(transaction, key, value)
-        
-    db.commit()
-    db.refresh(transaction)
-    return transaction
-
-
-@app.get("/api/available-periods")
-async def get_available_periods_endpoint(
-    current_user: models.User = Depends(auth.get_current_user),
-    db: Session = Depends(get_db)
-):
-    """Get available months and years from statements"""
-    return analytics.get_available_periods(db, current_user.id)
@@ -1,12 +1,17 @@
 """
 SQLAlchemy models for CardTrack
 """
-from sqlalchemy import Column, Integer, String, Float, DateTime, Date, ForeignKey, Boolean
+from sqlalchemy import Column, Integer, String, Float, DateTime, Date, ForeignKey, Boolean, Index
 from sqlalchemy.orm import relationship
-from datetime import datetime
+from datetime import datetime, timezone
 from .database import Base
 
 
+def utcnow() -> datetime:
+    """Current UTC time as a naive datetime (columns are timezone-naive)"""
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
 class User(Base):
     """User model with authentication"""
     __tablename__ = "users"
@@ -16,7 +21,7 @@ class User(Base):
     username = Column(String(100), unique=True, index=True, nullable=False)
     hashed_password = Column(String(255), nullable=False)
     is_active = Column(Boolean, default=True)
-    created_at = Column(DateTime, default=datetime.utcnow)
+    created_at = Column(DateTime, default=utcnow)
     
     # Relationships
     transactions = relationship("Transaction", back_populates="user", cascade="all, delete-orphan")
@@ -34,7 +39,7 @@ class Category(Base):
     icon = Column(String(10), default="📦")  # Emoji icon
     color = Column(String(7), default="#778899")  # Hex color
     is_default = Column(Boolean, default=False)
-    created_at = Column(DateTime, default=datetime.utcnow)
+    created_at = Column(DateTime, default=utcnow)
     
     # Relationships
     user = relationship("User", back_populates="categories")
@@ -62,13 +67,17 @@ class Statement(Base):
     proximo_cierre = Column(Date, nullable=True)  # PROXIMO CIERRE
     proximo_vencimiento = Column(Date, nullable=True)  # PROXIMO VENCIMIENTO
     
-    created_at = Column(DateTime, default=datetime.utcnow)
+    created_at = Column(DateTime, default=utcnow)
     
     # Relationships
     user = relationship("User", back_populates="statements")
     transactions = relationship("Transaction", back_populates="statement", cascade="all, delete-orphan")
 
 
+# Serves "latest statement for a user" lookups as a backward index scan reading one row
+Index("ix_statement_user_period", Statement.user_id, Statement.year.desc(), Statement.month.desc())
+
+
 class Transaction(Base):
     """Individual expense transaction"""
     __tablename__ = "transactions"
@@ -82,12 +91,28 @@ class Transaction(Base):
     is_dollar = Column(Boolean, default=False)  # True if amount is in USD
     date = Column(DateTime, nullable=False)
     description = Column(String(500), nullable=True)
-    created_at = Column(DateTime, default=datetime.utcnow)
+    created_at = Column(DateTime, default=utcnow)
     
     # Relationships
     user = relationship("User", back_populates="transactions")
-    statement = relationship("Statement", back_populates="transactions")
-    category = relationship("Category", back_populates="transactions")
+    # Every TransactionResponse nests both, so load them in one IN query per
+    # relationship instead of one lazy SELECT per row
+    statement = relationship("Statement", back_populates="transactions", lazy="selectin")
+    category = relationship("Category", back_populates="transactions", lazy="selectin")
+
+
+# Range scans over a user's spending in one currency (previous-period totals)
+Index("ix_tx_user_curr_date", Transaction.user_id, Transaction.is_dollar, Transaction.date)
+# Date-range scans across currencies (spending trend) and keyset pagination
+# of the transaction list (ORDER BY date DESC, id DESC)
+Index("ix_tx_user_date_id", Transaction.user_id, Transaction.date.desc(), Transaction.id.desc())
+# Category reassignment on delete and category filters
+Index("ix_tx_user_category", Transaction.user_id, Transaction.category_id)
+# Per-statement listings, already in ORDER BY date DESC order
+Index("ix_tx_user_statement_date", Transaction.user_id, Transaction.statement_id, Transaction.date.desc())
+# Lookups keyed only by statement: selectin loads of Statement.transactions
+# and the delete-orphan cascade
+Index("ix_tx_statement", Transaction.statement_id)
 
 
 # Default categories in Spanish (Argentinian)
@@ -101,4 +126,3 @@ DEFAULT_CATEGORIES = [
     {"name": "Suscripciones", "icon": "📱", "color": "#00d4ff"},
     {"name": "Otros", "icon": "📦", "color": "#778899"},
 ]
-
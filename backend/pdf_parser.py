@@ -3,13 +3,64 @@ PDF Parser for Mastercard Argentina Credit Card Statements
 Extracts transactions, balances, and calculates taxes from PDF statements
 """
 import re
+import logging
 from datetime import datetime
-from typing import List, Optional, Tuple
+from typing import BinaryIO, Callable, Iterator, List, Optional, Tuple, Union
 from dataclasses import dataclass
+from functools import lru_cache
 import pdfplumber
 
+try:
+    import pymupdf  # MuPDF's C engine; several times faster than pdfminer for plain text
+except ImportError:
+    try:
+        import fitz as pymupdf  # PyMuPDF releases before the "pymupdf" module name
+    except ImportError:
+        pymupdf = None
+
+try:
+    import ahocorasick  # pyahocorasick; matches every merchant keyword in one scan
+except ImportError:
+    ahocorasick = None
+
+logger = logging.getLogger(__name__)
+
+if pymupdf is not None:
+    logger.info("PDF text extraction: PyMuPDF %s", pymupdf.VersionBind)
+else:
+    logger.warning("PyMuPDF not installed; PDF text extraction falls back to the slower pdfplumber")
 
-@dataclass
+# Words whose tops are this close (in points) belong to the same line;
+# matches pdfplumber's default y_tolerance so both backends split lines alike
+LINE_Y_TOLERANCE = 3
+
+# Patterns compiled once at import (dates are DD-Mmm-YY, e.g. 26-Nov-25)
+_RE_DATE_PARSE = re.compile(r'(\d{1,2})-([A-Za-z]{3})-(\d{2})')
+_RE_TX = re.compile(
+    r'^(?P<date>\d{1,2}-[A-Za-z]{3}-\d{2})\s+(?P<body>.+?)'  # date, merchant/description
+    r'(?:\s+(?P<coupon>\d{5}))?'                              # optional 5-digit coupon
+    r'\s+(?P<amount>\(?-?\d[\d.,]*[.,]\d+\)?)\s*$'            # amount ends the line
+)
+_RE_SALDO_ACTUAL = re.compile(r'SALDO ACTUAL\s*\$?\s*([\d.,]+)\s*U\$S\s*([\d.,]+)', re.IGNORECASE)
+_RE_SALDO_PENDIENTE = re.compile(r'SALDO PENDIENTE\s+([\d.,]+)\s+([\d.,]+)', re.IGNORECASE)
+_RE_ESTADO = re.compile(r'ESTADO DE CUENTA AL:\s*(\d{1,2})-([A-Za-z]{3})-(\d{2})', re.IGNORECASE)
+_RE_PROX_CIERRE = re.compile(r'PROXIMO\s*CIERRE:\s*(\d{1,2})-([A-Za-z]{3})-(\d{2})', re.IGNORECASE)
+_RE_PROX_VENC = re.compile(r'PROXIMO\s*VENCIMIENTO:\s*(\d{1,2})-([A-Za-z]{3})-(\d{2})', re.IGNORECASE)
+# All page-0 header fields as one alternation, so a single scan finds them
+_HEADER_PATTERNS = {
+    'saldo_actual': _RE_SALDO_ACTUAL,
+    'saldo_pendiente': _RE_SALDO_PENDIENTE,
+    'estado': _RE_ESTADO,
+    'proximo_cierre': _RE_PROX_CIERRE,
+    'proximo_vencimiento': _RE_PROX_VENC,
+}
+_RE_HEADER = re.compile(
+    "|".join(f"(?P<{name}>{rx.pattern})" for name, rx in _HEADER_PATTERNS.items()),
+    re.IGNORECASE
+)
+
+
+@dataclass(slots=True)
 class Transaction:
     """Represents a single transaction from the statement"""
     date: datetime
@@ -20,7 +71,7 @@ class Transaction:
     is_dollar: bool = False
 
 
-@dataclass
+@dataclass(slots=True)
 class StatementData:
     """Parsed statement data"""
     saldo_actual_pesos: float
@@ -43,60 +94,79 @@ class StatementData:
 
 def parse_amount(text: str) -> float:
     """Parse an amount string to float, handling Argentine format (comma as decimal)"""
-    if not text or text.strip() == '':
+    if not text:
         return 0.0
     
     text = text.strip()
-    is_negative = text.startswith('-') or text.startswith('(')
-    text = text.replace('(', '').replace(')', '').replace('-', '').strip()
+    if not text:
+        return 0.0
+    
+    # Only pay for the replace passes that can change something; most
+    # amounts are plain "1.234,56" with no sign characters at all
+    is_negative = text[0] in '-('
+    if is_negative or ')' in text or '-' in text or '(' in text:
+        text = text.replace('(', '').replace(')', '').replace('-', '')
     
     # Handle Argentine format: 1.234,56 -> 1234.56
-    if ',' in text and '.' in text:
-        text = text.replace('.', '').replace(',', '.')
-    elif ',' in text:
+    if ',' in text:
+        if '.' in text:
+            text = text.replace('.', '')
         text = text.replace(',', '.')
     
     try:
         value = float(text)
-        return -value if is_negative else value
     except ValueError:
         return 0.0
+    return -value if is_negative else value
+
+
+MONTHS = {
+    'ene': 1, 'feb': 2, 'mar': 3, 'abr': 4, 'may': 5, 'jun': 6,
+    'jul': 7, 'ago': 8, 'sep': 9, 'oct': 10, 'nov': 11, 'dic': 12
+}
 
 
 def parse_date(text: str) -> Optional[datetime]:
     """Parse date in format DD-Mmm-YY (e.g., 26-Nov-25)"""
-    months = {
-        'ene': 1, 'feb': 2, 'mar': 3, 'abr': 4, 'may': 5, 'jun': 6,
-        'jul': 7, 'ago': 8, 'sep': 9, 'oct': 10, 'nov': 11, 'dic': 12
-    }
+    match = _RE_DATE_PARSE.match(text.strip())
+    if not match:
+        return None
     
     try:
-        match = re.match(r'(\d{1,2})-([A-Za-z]{3})-(\d{2})', text.strip())
-        if match:
-            day = int(match.group(1))
-            month_str = match.group(2).lower()
-            year = int(match.group(3)) + 2000
-            month = months.get(month_str, 1)
-            return datetime(year, month, day)
-    except Exception:
-        pass
-    
-    return None
+        return datetime(int(match[3]) + 2000, MONTHS.get(match[2].lower(), 1), int(match[1]))
+    except ValueError:  # e.g. 30-Feb-25
+        return None
+
+
+# Rows that look like transactions but are subtotals, payments or transfers
+SKIP_PATTERNS = [
+    'total titular',
+    'total adicional',
+    'saldo actual',
+    'pago minimo',
+    'detalle del mes',
+    'su pago',  # Payment line
+    'transfer financ',  # Transfer line
+]
+_RE_SKIP = re.compile("|".join(re.escape(p) for p in SKIP_PATTERNS), re.IGNORECASE)
 
 
 def is_subtotal_row(text: str) -> bool:
     """Check if a row is a subtotal row that should be skipped"""
-    text_lower = text.lower()
-    skip_patterns = [
-        'total titular',
-        'total adicional',
-        'saldo actual',
-        'pago minimo',
-        'detalle del mes',
-        'su pago',  # Payment line
-        'transfer financ',  # Transfer line
-    ]
-    return any(pattern in text_lower for pattern in skip_patterns)
+    return _RE_SKIP.search(text) is not None
+
+
+def find_header_fields(text: str) -> dict:
+    """
+    Find the first occurrence of each header field in one pass over the text.
+    Returns {field name: matched text}, to be parsed by the extract_* functions.
+    """
+    fields = {}
+    for match in _RE_HEADER.finditer(text):
+        fields.setdefault(match.lastgroup, match.group())
+        if len(fields) == len(_HEADER_PATTERNS):
+            break
+    return fields
 
 
 def extract_saldo_actual(text: str) -> Tuple[float, float]:
@@ -105,7 +175,7 @@ def extract_saldo_actual(text: str) -> Tuple[float, float]:
     saldo_dolares = 0.0
     
     # Pattern: SALDO ACTUAL $ 3051644,80 U$S 488,62
-    match = re.search(r'SALDO ACTUAL\s*\$?\s*([\d.,]+)\s*U\$S\s*([\d.,]+)', text, re.IGNORECASE)
+    match = _RE_SALDO_ACTUAL.search(text)
     if match:
         saldo_pesos = parse_amount(match.group(1))
         saldo_dolares = parse_amount(match.group(2))
@@ -122,7 +192,7 @@ def extract_saldo_pendiente(text: str) -> Tuple[float, float]:
     saldo_dolares = 0.0
     
     # Pattern: SALDO PENDIENTE followed by two numbers (pesos and dollars)
-    match = re.search(r'SALDO PENDIENTE\s+([\d.,]+)\s+([\d.,]+)', text, re.IGNORECASE)
+    match = _RE_SALDO_PENDIENTE.search(text)
     if match:
         saldo_pesos = parse_amount(match.group(1))
         saldo_dolares = parse_amount(match.group(2))
@@ -136,7 +206,7 @@ def extract_statement_date(text: str) -> Tuple[Optional[datetime], int, int]:
     Example: "ESTADO DE CUENTA AL: 31-Dic-25"
     """
     # Pattern: ESTADO DE CUENTA AL: DD-Mmm-YY
-    match = re.search(r'ESTADO DE CUENTA AL:\s*(\d{1,2})-([A-Za-z]{3})-(\d{2})', text, re.IGNORECASE)
+    match = _RE_ESTADO.search(text)
     if match:
         date_obj = parse_date(f"{match.group(1)}-{match.group(2)}-{match.group(3)}")
         if date_obj:
@@ -150,7 +220,7 @@ def extract_proximo_cierre(text: str) -> Optional[datetime]:
     Extract PROXIMO CIERRE date
     Example: "PROXIMO CIERRE: 29-Ene-26"
     """
-    match = re.search(r'PROXIMO\s*CIERRE:\s*(\d{1,2})-([A-Za-z]{3})-(\d{2})', text, re.IGNORECASE)
+    match = _RE_PROX_CIERRE.search(text)
     if match:
         return parse_date(f"{match.group(1)}-{match.group(2)}-{match.group(3)}")
     return None
@@ -161,7 +231,7 @@ def extract_proximo_vencimiento(text: str) -> Optional[datetime]:
     Extract PROXIMO VENCIMIENTO date
     Example: "PROXIMO VENCIMIENTO: 11-Feb-26"
     """
-    match = re.search(r'PROXIMO\s*VENCIMIENTO:\s*(\d{1,2})-([A-Za-z]{3})-(\d{2})', text, re.IGNORECASE)
+    match = _RE_PROX_VENC.search(text)
     if match:
         return parse_date(f"{match.group(1)}-{match.group(2)}-{match.group(3)}")
     return None
@@ -176,53 +246,34 @@ def parse_transaction_line(line: str) -> Optional[Transaction]:
     - 30-Nov-25 PUPPIS 02842 46500,00                             <- PESOS
     - 13-Dic-25 NETFLIX.COM (USA,ARS, 25398,00) 00779 17,63      <- USD
     """
-    # Skip subtotal rows
-    if is_subtotal_row(line):
+    # Pattern: DATE MERCHANT [COUPON] AMOUNT, matched in a single pass.
+    # Date is at the start: DD-Mmm-YY; the amount ends the line.
+    line = line.strip()
+    if not line or not line[0].isdigit():
+        return None  # headers and labels never reach the regex engine
+    
+    match = _RE_TX.match(line)
+    if not match:
         return None
     
-    # Pattern: DATE MERCHANT COUPON AMOUNT
-    # Date is at the start: DD-Mmm-YY
-    date_match = re.match(r'^(\d{1,2}-[A-Za-z]{3}-\d{2})\s+(.+)', line.strip())
-    if not date_match:
+    # Skip subtotal rows
+    if is_subtotal_row(line):
         return None
     
-    date = parse_date(date_match.group(1))
+    date = parse_date(match.group('date'))
     if not date:
         return None
     
-    rest = date_match.group(2).strip()
+    body = match.group('body')
     
     # Check if it's a USD transaction (contains USA,USD or USA,ARS in description)
-    is_dollar = 'USA,' in rest.upper()
+    is_dollar = 'USA,' in body.upper()
     
-    # Extract the amount at the END of the line (last number)
-    # Pattern: find the last number in the line
-    numbers = re.findall(r'-?[\d]+[.,][\d]+', rest)
-    
-    if not numbers:
-        return None
+    amount = parse_amount(match.group('amount'))
+    coupon = match.group('coupon') or ""
     
-    # Last number is the transaction amount
-    amount_str = numbers[-1]
-    amount = parse_amount(amount_str)
-    
-    # Find coupon number (5 digits before the amount)
-    coupon_match = re.search(r'\s(\d{5})\s+' + re.escape(amount_str.replace('.', r'\.').replace(',', r'\,')), rest)
-    coupon = coupon_match.group(1) if coupon_match else ""
-    
-    # Get merchant name (everything before the coupon or amount)
-    if coupon:
-        merchant = rest.split(coupon)[0].strip()
-    else:
-        # Just take everything before the last number
-        last_num_pos = rest.rfind(amount_str)
-        merchant = rest[:last_num_pos].strip()
-    
-    # Clean up merchant name
-    merchant = re.sub(r'\s+', ' ', merchant).strip()
-    
-    # Remove trailing numbers that might be coupon
-    merchant = re.sub(r'\s+\d{5}$', '', merchant)
+    # Clean up merchant name (collapse runs of whitespace)
+    merchant = ' '.join(body.split())
     
     # Assign to correct column based on transaction type
     if is_dollar:
@@ -245,9 +296,53 @@ def parse_transaction_line(line: str) -> Optional[Transaction]:
         )
 
 
-def parse_mastercard_pdf(file_path: str) -> StatementData:
+def _words_to_text(words) -> str:
+    """Join PyMuPDF words (x0, y0, x1, y1, text, ...) into lines, top to bottom"""
+    lines = []
+    current = []
+    line_top = None
+    for word in sorted(words, key=lambda w: (w[1], w[0])):
+        if line_top is None or word[1] - line_top > LINE_Y_TOLERANCE:
+            if current:
+                lines.append(current)
+            current = []
+            line_top = word[1]
+        current.append(word)
+    if current:
+        lines.append(current)
+    return "\n".join(" ".join(w[4] for w in sorted(line, key=lambda w: w[0])) for line in lines)
+
+
+def iter_page_texts(source: Union[str, BinaryIO]) -> Iterator[str]:
+    """Yield the text of each page, using PyMuPDF when installed and pdfplumber otherwise"""
+    if pymupdf is not None:
+        if isinstance(source, str):
+            doc = pymupdf.open(source)
+        else:
+            doc = pymupdf.open(stream=source.read(), filetype="pdf")
+        with doc:
+            for page in doc:
+                yield _words_to_text(page.get_text("words"))
+    else:
+        with pdfplumber.open(source) as pdf:
+            for page in pdf.pages:
+                yield _plumber_page_text(page)
+
+
+def _plumber_page_text(page) -> str:
+    """Plain (non-layout) text of a pdfplumber page, releasing its cached objects afterwards"""
+    text = page.extract_text(x_tolerance=3, y_tolerance=3, layout=False) or ""
+    # pdf.pages keeps every Page alive, so drop its chars/objects once read
+    page.flush_cache()
+    return text
+
+
+def parse_mastercard_pdf(source: Union[str, BinaryIO]) -> StatementData:
     """
     Parse a Mastercard Argentina PDF statement
+    
+    source can be a file path or a seekable binary stream (e.g. BytesIO),
+    so uploads can be parsed without writing them to disk first.
     """
     transactions: List[Transaction] = []
     saldo_pesos = 0.0
@@ -260,66 +355,58 @@ def parse_mastercard_pdf(file_path: str) -> StatementData:
     proximo_cierre = None
     proximo_vencimiento = None
     
-    print(f"[PDF Parser] Opening file: {file_path}")
+    logger.info("Opening PDF: %s", source if isinstance(source, str) else "upload stream")
     
-    with pdfplumber.open(file_path) as pdf:
-        full_text = ""
+    total_pesos = 0.0
+    total_dolares = 0.0
+    log_lines = logger.isEnabledFor(logging.DEBUG)
+    
+    # Lines are parsed page by page, so only one page of text is held at a time
+    for page_num, page_text in enumerate(iter_page_texts(source)):
+        logger.debug("Processing page %d", page_num + 1)
         
-        for page_num, page in enumerate(pdf.pages):
-            page_text = page.extract_text() or ""
-            full_text += page_text + "\n"
-            
-            print(f"[PDF Parser] Processing page {page_num + 1}")
+        # Extract header info from first page
+        if page_num == 0:
+            header = find_header_fields(page_text)
+            saldo_pesos, saldo_dolares = extract_saldo_actual(header.get('saldo_actual', ''))
+            saldo_pendiente_pesos, saldo_pendiente_dolares = extract_saldo_pendiente(header.get('saldo_pendiente', ''))
             
-            # Extract header info from first page
-            if page_num == 0:
-                saldo_pesos, saldo_dolares = extract_saldo_actual(page_text)
-                saldo_pendiente_pesos, saldo_pendiente_dolares = extract_saldo_pendiente(page_text)
-                print(f"[PDF Parser] SALDO ACTUAL: ${saldo_pesos:,.2f} pesos, ${saldo_dolares:,.2f} USD")
-                print(f"[PDF Parser] SALDO PENDIENTE: ${saldo_pendiente_pesos:,.2f} pesos, ${saldo_pendiente_dolares:,.2f} USD")
-                
-                # Extract dates
-                statement_date, month, year = extract_statement_date(page_text)
-                proximo_cierre = extract_proximo_cierre(page_text)
-                proximo_vencimiento = extract_proximo_vencimiento(page_text)
-                
-                if statement_date:
-                    print(f"[PDF Parser] ESTADO DE CUENTA AL: {statement_date.strftime('%d-%b-%Y')}")
-                if proximo_cierre:
-                    print(f"[PDF Parser] PROXIMO CIERRE: {proximo_cierre.strftime('%d-%b-%Y')}")
-                if proximo_vencimiento:
-                    print(f"[PDF Parser] PROXIMO VENCIMIENTO: {proximo_vencimiento.strftime('%d-%b-%Y')}")
+            # Extract dates
+            statement_date, month, year = extract_statement_date(header.get('estado', ''))
+            proximo_cierre = extract_proximo_cierre(header.get('proximo_cierre', ''))
+            proximo_vencimiento = extract_proximo_vencimiento(header.get('proximo_vencimiento', ''))
+            logger.debug(
+                "ESTADO DE CUENTA AL: %s, PROXIMO CIERRE: %s, PROXIMO VENCIMIENTO: %s",
+                statement_date, proximo_cierre, proximo_vencimiento
+            )
         
-        # Parse all lines for transactions
-        lines = full_text.split('\n')
-        for line in lines:
+        for line in page_text.splitlines():
             line = line.strip()
             if not line:
                 continue
             
-            # Check if line starts with date
-            if re.match(r'^\d{1,2}-[A-Za-z]{3}-\d{2}\s', line):
-                transaction = parse_transaction_line(line)
-                if transaction:
-                    transactions.append(transaction)
+            # Non-transaction lines are rejected by the line regex itself
+            transaction = parse_transaction_line(line)
+            if transaction:
+                transactions.append(transaction)
+                total_pesos += transaction.amount_pesos
+                total_dolares += transaction.amount_dollars
+                if log_lines:
                     pesos_str = f"${transaction.amount_pesos:,.2f}" if transaction.amount_pesos else ""
                     usd_str = f"U${transaction.amount_dollars:.2f}" if transaction.amount_dollars else ""
-                    print(f"[PDF Parser] {transaction.date.strftime('%d-%b-%y')} | {transaction.merchant[:35]:35} | {pesos_str:>15} | {usd_str:>10}")
-    
-    # Calculate totals
-    total_pesos = sum(t.amount_pesos for t in transactions)
-    total_dolares = sum(t.amount_dollars for t in transactions)
+                    logger.debug(f"{transaction.date.strftime('%d-%b-%y')} | {transaction.merchant[:35]:35} | {pesos_str:>15} | {usd_str:>10}")
     
     # Calculate taxes (difference between SALDO ACTUAL and sum of transactions, minus saldo pendiente)
     # Impuestos = Saldo Actual - Total Consumos - Saldo Pendiente
     impuestos_pesos = saldo_pesos - total_pesos - saldo_pendiente_pesos
     impuestos_dolares = saldo_dolares - total_dolares - saldo_pendiente_dolares
     
-    print(f"[PDF Parser] Total transactions: {len(transactions)}")
-    print(f"[PDF Parser] Sum of transactions: ${total_pesos:,.2f} pesos, ${total_dolares:,.2f} USD")
-    print(f"[PDF Parser] SALDO ACTUAL: ${saldo_pesos:,.2f} pesos, ${saldo_dolares:,.2f} USD")
-    print(f"[PDF Parser] SALDO PENDIENTE: ${saldo_pendiente_pesos:,.2f} pesos, ${saldo_pendiente_dolares:,.2f} USD")
-    print(f"[PDF Parser] Impuestos calculated: ${impuestos_pesos:,.2f} pesos, ${impuestos_dolares:,.2f} USD")
+    logger.info(
+        "Parsed %d transactions: sum $%.2f pesos / $%.2f USD, saldo actual $%.2f / $%.2f, "
+        "saldo pendiente $%.2f / $%.2f, impuestos $%.2f / $%.2f",
+        len(transactions), total_pesos, total_dolares, saldo_pesos, saldo_dolares,
+        saldo_pendiente_pesos, saldo_pendiente_dolares, impuestos_pesos, impuestos_dolares
+    )
     
     return StatementData(
         saldo_actual_pesos=saldo_pesos,
@@ -339,25 +426,85 @@ def parse_mastercard_pdf(file_path: str) -> StatementData:
     )
 
 
+def to_insert_rows(
+    stmt_data: StatementData,
+    user_id: int,
+    statement_id: int,
+    category_id_for: Callable[[Transaction, bool], Optional[int]] = lambda t, is_dollar: None
+) -> List[dict]:
+    """
+    Build Transaction row dicts for a bulk ``insert()``.
+    A transaction with both a pesos and a dollar amount yields one row per currency.
+    """
+    rows = []
+    for t in stmt_data.transactions:
+        description = f"Cupón: {t.coupon_number}" if t.coupon_number else None
+        for amount, is_dollar in ((t.amount_pesos, False), (t.amount_dollars, True)):
+            if amount != 0:
+                rows.append(dict(
+                    user_id=user_id,
+                    statement_id=statement_id,
+                    category_id=category_id_for(t, is_dollar),
+                    merchant=t.merchant,
+                    amount=abs(amount),
+                    is_dollar=is_dollar,
+                    date=t.date,
+                    description=description
+                ))
+    return rows
+
+
+# Merchant name patterns for auto-categorization (first matching category wins)
+MERCHANT_CATEGORIES = {
+    "Entretenimiento": ["google", "youtube", "netflix", "spotify", "steam", "playstation", "xbox", "hoyts", "cinema", "cine"],
+    "Educación": ["udemy", "coursera", "skillshare", "domestika", "platzi", "healingmind", "skills to", "timsykes", "traders agency"],
+    "Compras": ["mercadolibre", "amazon", "alibaba", "zara", "nike", "adidas", "jumbo", "carrefour", "coto", "dia tienda", "gift card"],
+    "Comida y Restaurantes": ["rappi", "pedidosya", "uber eats", "mcdonalds", "starbucks", "cafe", "restaurant", "panera", "cayena"],
+    "Tecnología": ["openai", "chatgpt", "github", "microsoft", "adobe", "dropbox"],
+    "Transporte": ["uber", "cabify", "ypf", "shell", "axion", "deheza", "autop"],
+    "Servicios": ["edenor", "edesur", "metrogas", "aysa", "telecom", "personal", "movistar", "claro", "naturgy", "arba", "zurich", "global z", "municipalidad"],
+    "Salud": ["farmacia", "farmacity", "osde", "swiss medical", "galeno"],
+    "Mascotas": ["puppis", "pet"],
+    "Pagos Digitales": ["merpago", "mercadopago", "paypal", "dlo*"],
+}
+
+# Compiled once at import; checked in MERCHANT_CATEGORIES order
+_MERCHANT_CATEGORY_PATTERNS = [
+    (category, re.compile("|".join(re.escape(kw) for kw in keywords)))
+    for category, keywords in MERCHANT_CATEGORIES.items()
+]
+
+
+def _build_merchant_automaton():
+    """Aho-Corasick automaton mapping each keyword to (category priority, category)"""
+    automaton = ahocorasick.Automaton()
+    for priority, (category, keywords) in enumerate(MERCHANT_CATEGORIES.items()):
+        for kw in keywords:
+            if kw not in automaton:  # first category listing a keyword keeps it
+                automaton.add_word(kw, (priority, category))
+    automaton.make_automaton()
+    return automaton
+
+
+_MERCHANT_AUTOMATON = _build_merchant_automaton() if ahocorasick is not None else None
+
+
 def get_category_for_merchant(merchant: str) -> str:
     """Auto-categorize merchant based on name patterns"""
-    merchant_lower = merchant.lower()
-    
-    categories = {
-        "Entretenimiento": ["google", "youtube", "netflix", "spotify", "steam", "playstation", "xbox", "hoyts", "cinema", "cine"],
-        "Educación": ["udemy", "coursera", "skillshare", "domestika", "platzi", "healingmind", "skills to", "timsykes", "traders agency"],
-        "Compras": ["mercadolibre", "amazon", "alibaba", "zara", "nike", "adidas", "jumbo", "carrefour", "coto", "dia tienda", "gift card"],
-        "Comida y Restaurantes": ["rappi", "pedidosya", "uber eats", "mcdonalds", "starbucks", "cafe", "restaurant", "panera", "cayena"],
-        "Tecnología": ["openai", "chatgpt", "github", "microsoft", "adobe", "dropbox"],
-        "Transporte": ["uber", "cabify", "ypf", "shell", "axion", "deheza", "autop"],
-        "Servicios": ["edenor", "edesur", "metrogas", "aysa", "telecom", "personal", "movistar", "claro", "naturgy", "arba", "zurich", "global z", "municipalidad"],
-        "Salud": ["farmacia", "farmacity", "osde", "swiss medical", "galeno"],
-        "Mascotas": ["puppis", "pet"],
-        "Pagos Digitales": ["merpago", "mercadopago", "paypal", "dlo*"],
-    }
-    
-    for category, keywords in categories.items():
-        if any(kw in merchant_lower for kw in keywords):
+    # Normalize before the cache so case/padding variants share one entry
+    return _category_for_normalized_merchant(merchant.strip().lower())
+
+
+@lru_cache(maxsize=4096)
+def _category_for_normalized_merchant(merchant_lower: str) -> str:
+    """Category for a stripped, lowercased merchant (cached; merchants repeat across statements)"""
+    if _MERCHANT_AUTOMATON is not None:
+        # Lowest priority among all hits = first matching category in table order
+        best = min((hit for _, hit in _MERCHANT_AUTOMATON.iter(merchant_lower)), default=None)
+        return best[1] if best else "Otros"
+    
+    for category, pattern in _MERCHANT_CATEGORY_PATTERNS:
+        if pattern.search(merchant_lower):
             return category
     
     return "Otros"
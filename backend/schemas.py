@@ -1,7 +1,7 @@
 """
 Pydantic schemas for API request/response validation
 """
-from pydantic import BaseModel, EmailStr, Field
+from pydantic import BaseModel, EmailStr, Field, field_validator
 from typing import Optional, List
 from datetime import datetime, date
 
@@ -104,6 +104,14 @@ class TransactionUpdate(BaseModel):
     date: Optional[datetime] = None
     category_id: Optional[int] = None
     description: Optional[str] = None
+    
+    @field_validator("merchant", "amount", "date")
+    @classmethod
+    def required_fields_not_null(cls, value):
+        """Fields may be omitted (partial update) but not set to null"""
+        if value is None:
+            raise ValueError("no puede ser null")
+        return value
 
 
 class TransactionResponse(TransactionBase):
@@ -165,6 +173,21 @@ class AnalyticsResponse(BaseModel):
     period: str
 
 
+class TrendPoint(BaseModel):
+    date: str  # day, week or month label depending on the period
+    total: float
+
+
+class PeriodMonth(BaseModel):
+    month: int
+    year: int
+
+
+class AvailablePeriods(BaseModel):
+    months: List[PeriodMonth]
+    years: List[int]
+
+
 # ============ Upload Schemas ============
 
 class UploadResponse(BaseModel):